@@ -0,0 +1,72 @@
+import numpy as np
+
+# number of bits in each word of the array
+WORD_BITS = 64
+WORD_SHIFT = 6
+WORD_MASK = WORD_BITS - 1
+
+
+# Array of m bits packed in 64 bit words (bit i is the bit i % 64 of the
+# word i // 64), so it takes m/8 bytes instead of a list slot per bit.
+# It can be indexed like the list of counters of the filters, giving 0 or 1
+# for each position, and the batch methods set or test many positions at once
+class BitArray:
+
+    def __init__(self, m):
+        # number of bits
+        self.m = m
+        self.words = np.zeros((m + WORD_MASK) >> WORD_SHIFT, dtype=np.uint64)
+
+    def __len__(self):
+        return self.m
+
+    # Retrieve the bit at a position (0 or 1), or the bits at an array of
+    # positions with the same shape or at a slice of the positions
+    def __getitem__(self, position):
+        if isinstance(position, (int, np.integer)):
+            return int(self.words[position >> WORD_SHIFT] >> np.uint64(position & WORD_MASK)) & 1
+        if isinstance(position, slice):
+            return self.unpack()[position]
+        return self.test_many(position).astype(np.uint8)
+
+    # Retrieve all the bits unpacked in an array of np.uint8 (a copy), which
+    # is used when the bits are given to numpy (np.asarray)
+    def __array__(self, dtype=None, copy=None):
+        bits = self.unpack()
+        return bits if dtype is None else bits.astype(dtype)
+
+    # Set the bit at a position
+    def set(self, position):
+        self.words[position >> WORD_SHIFT] |= np.uint64(1 << (position & WORD_MASK))
+        return
+
+    # Check whether the bit at a position is set
+    def test(self, position):
+        return (int(self.words[position >> WORD_SHIFT]) >> (position & WORD_MASK)) & 1 == 1
+
+    # Set the bits at an array of positions (any shape)
+    def set_many(self, positions):
+        positions = np.asarray(positions, dtype=np.int64).reshape(-1)
+        bits = np.left_shift(np.uint64(1), (positions & WORD_MASK).astype(np.uint64))
+        np.bitwise_or.at(self.words, positions >> WORD_SHIFT, bits)
+        return
+
+    # Check the bits at an array of positions. Returns an array of booleans
+    # with the same shape
+    def test_many(self, positions):
+        positions = np.asarray(positions, dtype=np.int64)
+        words = self.words[positions >> WORD_SHIFT]
+        return (words >> (positions & WORD_MASK).astype(np.uint64)) & np.uint64(1) == 1
+
+    # Set all the bits to 0
+    def clear(self):
+        self.words.fill(0)
+        return
+
+    # Number of bits set
+    def count(self):
+        return int(np.unpackbits(self.words.view(np.uint8)).sum())
+
+    # Retrieve all the bits in an array of np.uint8, one for each position
+    def unpack(self):
+        return np.unpackbits(self.words.astype('<u8').view(np.uint8), bitorder='little')[:self.m]
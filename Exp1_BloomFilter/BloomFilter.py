@@ -2,22 +2,45 @@ import hashlib
 import math
 import random
 import string
+from operator import itemgetter
 
+import numpy as np
+
+from BitArray import BitArray
 from GenericHashFunctionsMD5 import GenericHashFunctionsMD5
+from HashBackends import make_hash
+
+
+# Reads the items of a list at an array of positions as an array with the
+# same shape. The list is only converted as a whole when there are as many
+# positions as items, otherwise the items are taken one by one with
+# itemgetter, so a batch does not cost O(m)
+def gather_list(items, positions):
+    if positions.size >= len(items):
+        return np.asarray(items)[positions]
+    flat = positions.reshape(-1).tolist()
+    if len(flat) == 1:
+        return np.array([items[flat[0]]], dtype=np.int64).reshape(positions.shape)
+    return np.array(itemgetter(*flat)(items) if flat else (), dtype=np.int64).reshape(positions.shape)
 
 
 # Bloom filter
 class BloomFilter:
     bloom_structure = []
 
-    def __init__(self, m=65536, nhash=5, hash_f=None):
+    def __init__(self, m=65536, nhash=5, hash_f=None, packed=False):
         # number of counters
         self.m = m
-        # the structure is stored as a flattened array
-        self.bloom_structure = [0] * m
-        # the hash class used to generate the functions
+        # the structure is stored as a flattened array, a list with a 0 or a
+        # 1 for each bit or, when packed, a BitArray with 64 bits per word
+        self.packed = packed
+        self.bloom_structure = BitArray(m) if packed else [0] * m
+        # the hash class used to generate the functions, which can also
+        # be given by the name of one of the registered hash backends
         if hash_f is None:
             self.hash = GenericHashFunctionsMD5(m, nhash)
+        elif isinstance(hash_f, str):
+            self.hash = make_hash(hash_f, m, nhash)
         else:
             self.hash = hash_f
         # the number of hashes per group, apart from the word hash function
@@ -25,7 +48,10 @@ class BloomFilter:
 
     # clear the list of counters
     def clear(self):
-        self.bloom_structure = [0] * len(self.bloom_structure)
+        if self.packed:
+            self.bloom_structure.clear()
+        else:
+            self.bloom_structure = [0] * len(self.bloom_structure)
 
     # Change the hash object that generates the function
     def set_hash(self, hash_object):
@@ -37,36 +63,126 @@ class BloomFilter:
     def get_hash(self):
         return self.hash
 
+    # Retrieve the parameters of the filter, with the ones of its hash
+    # object, so an equivalent empty filter can be created (see FilterIO)
+    def get_config(self):
+        return {'class': type(self).__name__, 'm': self.m, 'nhash': self.nhash, 'packed': self.packed,
+                'hash': self.hash.get_config()}
+
+    # Retrieve the positions of the bits for a (N, nhash) matrix with the
+    # bit indices of N elements (see hash_many). They are the same indices
+    def positions_from_indices(self, indices):
+        return indices
+
     # method to add an element into the filter
     def add(self, data):
-        # extract a position from each hash to set the bit in the selected word
-        for i in range(self.nhash):
-            # position for the ith hash of the group_i function
-            # the final position in the array is a combination
-            # of word index and bit index
-            idx = self.hash.getbit_idx(data, i)
-            # idx = int(bitidx)
-
-            # set the appropriate bit
+        # the positions given by all the hashes are retrieved at once
+        # and the appropriate bits are set
+        if self.packed:
+            for idx in self.hash.get_indices(data):
+                self.bloom_structure.set(idx)
+            return
+        for idx in self.hash.get_indices(data):
             self.bloom_structure[idx] = 1
 
         return
 
     # check the bloom filter for the specified data
     def check(self, data, threshold=1):
-        # extract a position from each hash to get the bit from the selected word
-        for i in range(self.nhash):
-            # position for the ith hash of the group_i function
-            # the final position in the array is a combination
-            # of word index and bit index
-            idx = self.hash.getbit_idx(data, i)
-
+        # get the bit from the position given by each hash
+        for idx in self.hash.get_indices(data):
             # check if the bit is at least the threshold for the specified word
             # if not, the data is a negative
             if self.bloom_structure[idx] < threshold:
                 return False
         return True
 
+    # method to add a sequence of elements into the filter, hashed in a single batch
+    def add_many(self, data):
+        self.add_indices(self.hash.hash_many(data))
+        return
+
+    # check a sequence of elements at once. Returns an array of booleans
+    def check_many(self, data, threshold=1):
+        return self.check_indices(self.hash.hash_many(data), threshold)
+
+    # Set the bits of a (N, nhash) matrix with the bit indices of N elements
+    # (see hash_many), adding the N elements at once
+    def add_indices(self, indices):
+        if self.packed:
+            self.bloom_structure.set_many(indices)
+            return
+        for idx in np.asarray(indices).reshape(-1).tolist():
+            self.bloom_structure[idx] = 1
+        return
+
+    # Check a (N, nhash) matrix with the bit indices of N elements. Returns
+    # an array of N booleans, True for the positives
+    def check_indices(self, indices, threshold=1):
+        indices = np.asarray(indices, dtype=np.int64)
+        if self.packed:
+            # the packed bits are unpacked only at the given positions
+            bits = self.bloom_structure[indices]
+        else:
+            bits = gather_list(self.bloom_structure, indices)
+        return (bits >= threshold).all(axis=1)
+
+    # Check that other gives the same positions to the elements as this
+    # filter (same class, size, hashes and hash parameters), so the bits of
+    # both can be combined. One of them can be packed and the other not
+    def check_compatible(self, other):
+        config = self.get_config()
+        other_config = other.get_config()
+        config.pop('packed')
+        other_config.pop('packed')
+        if config != other_config:
+            raise ValueError("The filters are not compatible: " + str(config) + " and " + str(other_config))
+        return
+
+    # Set the bits of other, a compatible filter, in this one (OR of both
+    # filters), as if the elements of other were added to this filter
+    def merge(self, other):
+        self.check_compatible(other)
+        if self.packed and other.packed:
+            self.bloom_structure.words |= other.bloom_structure.words
+        elif self.packed:
+            self.bloom_structure.set_many(np.flatnonzero(np.asarray(other.bloom_structure)))
+        else:
+            bits = np.asarray(self.bloom_structure) | np.asarray(other.bloom_structure)
+            self.bloom_structure[:] = bits.tolist()
+        return
+
+    # bf += other merges the filters
+    def __iadd__(self, other):
+        self.merge(other)
+        return self
+
+    # Retrieve the statistics of the bits, computed with numpy over all of
+    # them at once (the same ones as the stats of the counting filters):
+    #   * histogram: number of bits that are 0 and 1
+    #   * zero_fraction: fraction of bits that are 0
+    #   * max_counter: 1 when some bit is set, 0 otherwise
+    #   * elements: number of elements in the filter, given or estimated from
+    #     the bits that are 0 as m/k * ln(1/zero_fraction)
+    #   * theoretical_fpr: false positive rate expected with those elements
+    #   * estimated_fpr: false positive rate given by the bits that are set
+    #   * bytes: memory taken by the bits (a pointer for each item of the list)
+    def stats(self, elements=None):
+        if self.packed:
+            ones = self.bloom_structure.count()
+            size = self.bloom_structure.words.nbytes
+        else:
+            ones = int(np.asarray(self.bloom_structure).sum())
+            size = 8 * len(self.bloom_structure)
+        zero_fraction = (self.m - ones) / self.m
+        if elements is None:
+            elements = self.m / self.nhash * math.log(1 / zero_fraction) if zero_fraction > 0 else math.inf
+        return {'histogram': [self.m - ones, ones] if ones else [self.m], 'zero_fraction': zero_fraction,
+                'max_counter': 1 if ones else 0, 'elements': elements,
+                'theoretical_fpr': (1 - math.exp(-self.nhash * elements / self.m)) ** self.nhash,
+                'estimated_fpr': (1 - zero_fraction) ** self.nhash,
+                'bytes': size}
+
     # Retrieve the value of a counter
     def get_counter(self, position):
         if len(self.bloom_structure) < position:
@@ -1,7 +1,12 @@
 import random
+import numpy as np
 import sys
 import getopt
+import argparse
 from BloomFilter import BloomFilter
+from HashBackends import HASH_BACKENDS, make_hash
+from UniverseIndexTable import find_p_table
+from GenericHashFunctions import BATCH_SIZE
 from GenericHashFunctionsSHA512 import GenericHashFunctionsSHA512
 from Heuristics import *
 import matplotlib
@@ -16,6 +21,14 @@ n = 16
 max_val = 100000
 falses = 64
 
+parser = argparse.ArgumentParser()
+parser.add_argument("-H", dest="hash", choices=sorted(HASH_BACKENDS), help="Hash backend (default md5)", default="md5")
+parser.add_argument("-d", dest="digest_size", type=int, help="Digest size in bytes of the blake2b backend (default 16)", default=16)
+parser.add_argument("-b", dest="packed", action="store_true", help="Store the bits of the filter packed in 64 bit words")
+args = parser.parse_args()
+hash_name = args.hash
+hash_params = {'digest_size': args.digest_size} if hash_name == 'blake2b' else {}
+
 # Function to generate the random set of elements.
 # Current version uses strings
 # num is the number of elements to generate
@@ -32,6 +45,7 @@ def generate_random_elements(num, bf=None, ds=None, max_val=1000000000, exclude=
 
     # Keeps data of stored elements
     stored = 0
+    entries = []
     # Generate elements until the value "stored" is reached
     while stored < num:
         # Generate integers between 1 and max_val
@@ -40,10 +54,8 @@ def generate_random_elements(num, bf=None, ds=None, max_val=1000000000, exclude=
         # go to next iteration
         if entry in s or entry in exclude:
             continue
-        # When an BloomFilter is received
-        if bf is not None:
-            # Add the entry to the filter
-            bf.add(entry)
+        # Keep the entry to add it to the filter
+        entries.append(entry)
         # When a list is received
         if ds is not None:
             # Add the element to the list
@@ -52,6 +64,9 @@ def generate_random_elements(num, bf=None, ds=None, max_val=1000000000, exclude=
         stored = stored + 1
         # Add it to the set so they are not repeated
         s.add(entry)
+    # When a filter is received, all the entries are added to it in a single batch
+    if bf is not None:
+        bf.add_many(entries)
     return
 
 # Function to generate a random set of false positives
@@ -89,15 +104,20 @@ def generate_random_fp(num, bf, max_val=1000000000, exclude=None):
 # Function to find all elements from the universe that returns a positive from CBF
 # bf is the Bloom Filter
 # max_val is the maximum integer value. Universe will include elements from 1 to max_val
-def find_p(bf, max_val):
+# table is an optional index table of the universe precomputed with the hash of bf
+# (see UniverseIndexTable), so the elements are not hashed again
+def find_p(bf, max_val, table=None):
+    if table is not None:
+        return find_p_table(bf, table, max_val)
     # Create the list P of (true and false) positive elements
     p = list()
-    # Check all elements of the universe, from 1 to max_val
-    for i in range(max_val+1):
+    # Check all elements of the universe, from 1 to max_val, by batches
+    for start in range(0, max_val+1, BATCH_SIZE):
+        batch = range(start, min(start + BATCH_SIZE, max_val+1))
         # If one of the positions is 0, then it is a negative
         # Otherwise, add it to P
-        if bf.check(i, 1):
-            p.append(i)
+        positive = bf.check_many(batch, 1)
+        p.extend(batch[i] for i in np.flatnonzero(positive).tolist())
 
     return p
 
@@ -117,10 +137,8 @@ def clear_positions(elements, positives, count_bf, count, hashf, k):
     for i in range(num):
         # get next element to be removed
         next_positive = positives[i]
-        # for the k hash functions
-        for j in range(k):
-            # Get the position mapped for the element and the jth hash function
-            jpos = hashf.getbit_idx(next_positive, j)
+        # for the positions of the k hash functions
+        for jpos in hashf.get_indices(next_positive):
             # Element might have been removed in a different level of recursion
             if elements[jpos].count(next_positive) == 0:
                 break
@@ -145,12 +163,12 @@ def probabilistic_peeling(m, k, bf, p, h):
     # Count of elements mapped to each position
     count = [0] * m
 
+    # Positions of all the elements in p, hashed in a single batch
+    indices = hashf.hash_many(p).tolist()
     # For all the positions in p
     for i in range(len(p)):
-        # for the k hash functions
-        for j in range(k):
-            # Get the position mapped for the element p[i] and the jth hash function
-            pos = hashf.getbit_idx(p[i], j)
+        # for the positions of the k hash functions
+        for pos in indices[i]:
             # Retrieve the position pos of the T array
             list_pos = elements[pos]
             # If no elements are assigned to that position, create a list and assign it
@@ -202,7 +220,7 @@ for falses in range(1, falses+1):
     avg = 0
     for _ in range(100):
         # Generate a standard bloom filter with the testing parameters
-        bf = BloomFilter(filter_size, k)
+        bf = BloomFilter(filter_size, k, make_hash(hash_name, filter_size, k, **hash_params), args.packed)
 
         # Fill the filter with random elements
         true_positives = []
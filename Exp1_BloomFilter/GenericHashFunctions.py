@@ -0,0 +1,319 @@
+import math
+from collections import OrderedDict
+
+import numpy as np
+
+# number of elements hashed together in each step of the batch functions
+BATCH_SIZE = 65536
+MASK64 = (1 << 64) - 1
+
+# Encodings of the elements into the bytes that are hashed
+# str: the decimal string of the element, as in the original code
+# u64: the integer packed in 8 bytes (big endian), without formatting it
+STR_KEYS = 'str'
+U64_KEYS = 'u64'
+KEY_ENCODINGS = (STR_KEYS, U64_KEYS)
+BYTES_TYPES = (bytes, bytearray, memoryview)
+
+# extra bits taken for each bit index when the number of counters is not a
+# power of two, so the reduction to [0, k) is (almost) uniform
+RANGE_EXTRA_BITS = 16
+
+
+# Number of bits of the digest used for each bit index with k counters: just
+# log2(k) for powers of two, and some more bits otherwise. When each bit
+# index can take at most room bits of the digest, only the extra bits that
+# fit are taken (fewer extra bits make the reduction less uniform)
+def index_width(k, room=None):
+    if k & (k - 1) == 0:
+        return int(math.log2(k))
+    width = math.ceil(math.log2(k))
+    extra = RANGE_EXTRA_BITS if room is None else min(RANGE_EXTRA_BITS, room - width)
+    return width + max(extra, 0)
+
+
+# Computes (g * m) >> 64 for an array g of np.uint64 and m < 2^32 without
+# overflowing 64 bits, multiplying the two halves of g separately
+def mulhi64(g, m):
+    m = np.uint64(m)
+    high = g >> np.uint64(32)
+    low = g & np.uint64(0xFFFFFFFF)
+    return (high * m + ((low * m) >> np.uint64(32))) >> np.uint64(32)
+
+
+# Common code for the hash classes. A single digest is calculated for each
+# element and it is split in nhash bit indices, taking bitidx_size bits for
+# each one starting from the most significant bit of the digest.
+# With double hashing, the first 128 bits of the digest are taken as two
+# 64 bit hashes h1 and h2 instead, and the nth bit index is given by the
+# most significant bits of h1 + n*h2, so any number of hashes can be used.
+# When k is not a power of two, every bit index x of w bits is reduced to
+# [0, k) with a multiplication and a shift, (x * k) >> w, instead of a modulo.
+# Elements given as bytes are hashed as they are, any other element is
+# encoded first with the key_encoding of the object
+class GenericHashFunctions:
+
+    def __init__(self, hash_f, digest_bits, k=1024, nhash=2, cache_size=0, double_hashing=False,
+                 key_encoding=STR_KEYS):
+        # the underlying hash function to be used
+        self.hash = hash_f
+        # the number of bits provided by the hash function
+        self.digest_bits = digest_bits
+
+        # the number of hashes
+        self.nhash = nhash
+        # the number of counters, the bit indices are in [0, k)
+        self.m = k
+        self.pow2 = k & (k - 1) == 0
+        # the size of each bit index to set/get a bit, limited to the bits of
+        # the digest for each hash when it is split
+        if digest_bits is None or double_hashing:
+            self.bitidx_size = index_width(k)
+        else:
+            self.bitidx_size = index_width(k, digest_bits // nhash)
+        # mask to keep only the bitidx_size lowest bits
+        self.bitidx_mask = (1 << self.bitidx_size) - 1
+        # the nth bit index skips the previous n-1 bit indices from the most
+        # significant bit, so it is moved to the lowest bits with this shift
+        self.shifts = tuple((digest_bits or 0) - self.bitidx_size * (n + 1) for n in range(nhash))
+
+        # double hashing only needs 128 bits for any number of hashes
+        self.double_hashing = double_hashing
+        # shift to keep the bitidx_size most significant bits of h1 + n*h2
+        # (only for powers of two)
+        self.double_shift = 64 - self.bitidx_size
+        # the reduction of the vectorised code multiplies by k in 32 bit halves
+        assert self.pow2 or k < (1 << 32)
+
+        # the hash provides digest_bits bits. With those bits we have to build:
+        #   * The nhash functions (g) to select the bits to be set/retrieved
+        # (hash classes that do not split a digest give None as digest_bits)
+        if digest_bits is None:
+            pass
+        elif double_hashing:
+            assert digest_bits >= 128
+        else:
+            assert digest_bits >= (nhash * self.bitidx_size), \
+                "The digest has not enough bits for " + str(nhash) + " hashes of " + str(k) + " counters, use double hashing"
+
+        # how the elements that are not bytes are turned into bytes
+        assert key_encoding in KEY_ENCODINGS
+        self.key_encoding = key_encoding
+
+        # keep the key of the last hash element and its indices to avoid hash
+        # recalculation
+        self.lastelement = None
+        self.lasthash = None
+
+        # optional LRU cache with the indices of the last cache_size elements
+        # (0 disables it and only the last element is kept)
+        self.cache_size = cache_size
+        self.cache = OrderedDict() if cache_size > 0 else None
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_evictions = 0
+        return
+
+    # Turns the element into the bytes to be hashed
+    def encode(self, element):
+        if isinstance(element, BYTES_TYPES):
+            return element
+        if self.key_encoding == U64_KEYS:
+            try:
+                return element.to_bytes(8, 'big')
+            except (AttributeError, OverflowError):
+                # numpy integers, negative or too big integers
+                return (int(element) & MASK64).to_bytes(8, 'big')
+        return str(element).encode()
+
+    # Turns a sequence of elements into a list of keys to be hashed, so a set
+    # of elements can be encoded once and hashed many times. When key_width
+    # is given, elements is a buffer with keys of key_width bytes each one
+    # after the other (bytes or any object with the buffer protocol)
+    def encode_many(self, elements, key_width=None):
+        if key_width is not None:
+            if not isinstance(elements, bytes):
+                elements = memoryview(elements).cast('B').tobytes()
+            return [elements[start:start + key_width] for start in range(0, len(elements), key_width)]
+        if not isinstance(elements, (list, tuple, np.ndarray, range)):
+            elements = list(elements)
+        if self.key_encoding == U64_KEYS and len(elements) > 0 and not isinstance(elements[0], BYTES_TYPES):
+            return self.encode_many(pack_keys(elements), 8)
+        return [self.encode(element) for element in elements]
+
+    # Turns a key back into its integer, for the hashes of integer elements
+    def decode_int(self, key):
+        if self.key_encoding == U64_KEYS:
+            return int.from_bytes(key, 'big')
+        return int(bytes(key))
+
+    # Same as decode_int for a sequence of elements (or a buffer of keys),
+    # returned as an array of np.uint64
+    def decode_int_many(self, elements, key_width=None):
+        if key_width is None:
+            if not isinstance(elements, (list, tuple, np.ndarray, range)):
+                elements = list(elements)
+            if len(elements) == 0 or not isinstance(elements[0], BYTES_TYPES):
+                return int_keys(elements).reshape(-1)
+        elif key_width == 8 and self.key_encoding == U64_KEYS:
+            return np.frombuffer(elements, dtype='>u8').astype(np.uint64)
+        keys = self.encode_many(elements, key_width)
+        return np.array([self.decode_int(key) & MASK64 for key in keys], dtype=np.uint64)
+
+    # Calculates the digest of the key (bytes) as an integer
+    def digest(self, key):
+        return int.from_bytes(self.hash(key).digest(), 'big')
+
+    # Splits the integer digest in the nhash bit indices
+    def digest_indices(self, value):
+        if self.double_hashing:
+            h1 = value >> (self.digest_bits - 64)
+            h2 = (value >> (self.digest_bits - 128)) & MASK64
+            if self.pow2:
+                shift = self.double_shift
+                return tuple(((h1 + n * h2) & MASK64) >> shift for n in range(self.nhash))
+            m = self.m
+            return tuple((((h1 + n * h2) & MASK64) * m) >> 64 for n in range(self.nhash))
+        mask = self.bitidx_mask
+        if self.pow2:
+            return tuple((value >> shift) & mask for shift in self.shifts)
+        m = self.m
+        size = self.bitidx_size
+        return tuple((((value >> shift) & mask) * m) >> size for shift in self.shifts)
+
+    # Retrieves the bit indices of all the hashes for the element. The last
+    # element and the LRU cache are looked up by the encoded key, so equal
+    # elements with different keys (5 and 5.0, 1 and True) are told apart
+    def get_indices(self, element):
+        key = self.encode(element)
+        if type(key) is not bytes:
+            # keep a hashable copy for the caches
+            key = bytes(key)
+        if self.lastelement == key:
+            return self.lasthash
+        if self.cache is None:
+            indices = self.digest_indices(self.digest(key))
+        else:
+            indices = self.cache.get(key)
+            if indices is not None:
+                # mark the element as the most recently used one
+                self.cache.move_to_end(key)
+                self.cache_hits += 1
+            else:
+                indices = self.digest_indices(self.digest(key))
+                self.cache_misses += 1
+                self.cache[key] = indices
+                # evict the least recently used element when full
+                if len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+                    self.cache_evictions += 1
+        # Assign this element as the active element and keep its indices
+        self.lastelement = key
+        self.lasthash = indices
+        return indices
+
+    # Retrieves the parameters that define the bit indices given by this
+    # object, so an equivalent one can be created (see HashBackends)
+    def get_config(self):
+        return {'class': type(self).__name__, 'k': self.m, 'nhash': self.nhash,
+                'double_hashing': self.double_hashing, 'key_encoding': self.key_encoding}
+
+    # Retrieves the statistics of the LRU cache. Calls for the same element
+    # as the previous one are not counted, they never reach the cache
+    def get_cache_stats(self):
+        return {'capacity': self.cache_size,
+                'size': 0 if self.cache is None else len(self.cache),
+                'hits': self.cache_hits,
+                'misses': self.cache_misses,
+                'evictions': self.cache_evictions}
+
+    # Empties the LRU cache and resets its statistics
+    def clear_cache(self):
+        if self.cache is not None:
+            self.cache.clear()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_evictions = 0
+        return
+
+    # Splits a (N, digest_bits/8) matrix of digest bytes in the nhash bit
+    # indices of each row. Every bit index is read from the 8 bytes starting
+    # at the byte that contains its first bit, as a big endian 64 bit word
+    def digests_indices(self, digests):
+        num = digests.shape[0]
+        if self.double_hashing:
+            return self.digests_double_indices(digests)
+        # pad the digests so the last word can always be read
+        padded = np.zeros((num, digests.shape[1] + 8), dtype=np.uint8)
+        padded[:, :digests.shape[1]] = digests
+        indices = np.empty((num, self.nhash), dtype=np.int64)
+        mask = np.uint64(self.bitidx_mask)
+        for n in range(self.nhash):
+            start = self.bitidx_size * n
+            byte = start // 8
+            word = np.ascontiguousarray(padded[:, byte:byte + 8]).view('>u8')[:, 0].astype(np.uint64)
+            shift = np.uint64(64 - (start - 8 * byte) - self.bitidx_size)
+            if self.pow2:
+                indices[:, n] = (word >> shift) & mask
+            else:
+                # (x * k) >> w is the same as the high word of (x << (64 - w)) * k
+                word = (word >> shift) & mask
+                indices[:, n] = mulhi64(word << np.uint64(64 - self.bitidx_size), self.m)
+        return indices
+
+    # Same as digests_indices with double hashing. The additions of h1 + n*h2
+    # wrap around 64 bits as in digest_indices
+    def digests_double_indices(self, digests):
+        words = np.ascontiguousarray(digests[:, :16]).view('>u8').astype(np.uint64)
+        h1 = words[:, 0]
+        h2 = words[:, 1]
+        indices = np.empty((digests.shape[0], self.nhash), dtype=np.int64)
+        shift = np.uint64(self.double_shift)
+        value = h1.copy()
+        for n in range(self.nhash):
+            if self.pow2:
+                indices[:, n] = value >> shift
+            else:
+                indices[:, n] = mulhi64(value, self.m)
+            value += h2
+        return indices
+
+    # Retrieves the bit indices of all the hashes for a sequence of elements
+    # as a contiguous (N, nhash) array, with the same values as get_indices.
+    # The elements can also be already encoded keys, or a buffer of keys of
+    # key_width bytes (see encode_many)
+    def hash_many(self, elements, key_width=None):
+        # the bit indices must fit in a 64 bit word with their byte offset
+        assert self.double_hashing or self.bitidx_size <= 57
+        keys = self.encode_many(elements, key_width)
+        num = len(keys)
+        indices = np.empty((num, self.nhash), dtype=np.int64)
+        for start in range(0, num, BATCH_SIZE):
+            chunk = keys[start:start + BATCH_SIZE]
+            indices[start:start + len(chunk)] = self.digests_indices(self.digest_many(chunk))
+        return indices
+
+    # Calculates the digests of a list of keys as a (N, digest_bits/8) matrix
+    # of bytes. The digests are calculated one by one, but split all together
+    def digest_many(self, keys):
+        digests = b''.join([self.hash(key).digest() for key in keys])
+        return np.frombuffer(digests, dtype=np.uint8).reshape(-1, self.digest_bits // 8)
+
+    # Retrieves the bit index using the nth hash for the element
+    def getbit_idx(self, element, n):
+        return self.get_indices(element)[n]
+
+
+# Turns a sequence of integers into an array of np.uint64, masking negative
+# or too big integers to 64 bits as the u64 key encoding does
+def int_keys(elements):
+    try:
+        return np.asarray(elements, dtype=np.uint64)
+    except OverflowError:
+        return np.array([int(element) & MASK64 for element in elements], dtype=np.uint64)
+
+
+# Packs a sequence of integers in a buffer of 8 byte keys (big endian), the
+# same bytes used by the u64 key encoding
+def pack_keys(elements):
+    return int_keys(elements).astype('>u8').tobytes()
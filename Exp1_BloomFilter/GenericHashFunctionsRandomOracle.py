@@ -0,0 +1,117 @@
+import numpy as np
+
+from GenericHashFunctions import GenericHashFunctions, STR_KEYS, mulhi64
+from GenericHashFunctionsSplitMix64 import MASK64, GOLDEN64, mix64, mix64_array
+
+
+# Folds a seed (an integer or a tuple of integers) into a 64 bit key
+def seed_key(seed):
+    if not isinstance(seed, (tuple, list)):
+        seed = [seed]
+    key = 0
+    for value in seed:
+        key = mix64(((key ^ value) + GOLDEN64) & MASK64)
+    return key
+
+
+# Idealised hash for Monte Carlo simulations: the positions of each element
+# (an integer id below 2^64) are uniform and independent for every seed.
+# The nth position of an id is taken from a counter-based generator, the
+# splitmix64 finaliser of (seed, id, n), so it is computed for any id in a
+# few operations (vectorised in hash_many) and it only depends on the seed,
+# not on the order of the queries. Optionally, the positions of blocks of
+# block_size consecutive ids are kept for up to max_blocks blocks, which
+# only helps when the same ranges of ids are hashed again and again
+class GenericHashFunctionsRandomOracle(GenericHashFunctions):
+
+    def __init__(self, k=1024, nhash=2, cache_size=0, double_hashing=False, key_encoding=STR_KEYS,
+                 seed=0, block_size=4096, max_blocks=0):
+        # the number of counters, positions are drawn in [0, k)
+        self.m = k
+        # number of ids in each block and maximum number of blocks kept
+        # (0 disables the blocks, evicted blocks are computed again)
+        self.block_size = block_size
+        self.max_blocks = max_blocks
+        self.blocks = {}
+        self.seed = seed
+        self.key = seed_key(seed)
+        # every position is drawn independently, so double_hashing does not
+        # apply here and it is only accepted for compatibility
+        GenericHashFunctions.__init__(self, None, None, k, nhash, cache_size, False, key_encoding)
+        return
+
+    # Changes the seed (e.g. for a new trial), forgetting all the positions
+    def reseed(self, seed):
+        self.seed = seed
+        self.key = seed_key(seed)
+        self.blocks.clear()
+        self.clear_cache()
+        self.lastelement = None
+        self.lasthash = None
+        return
+
+    # Retrieves the parameters of the object, including the seed
+    def get_config(self):
+        config = GenericHashFunctions.get_config(self)
+        config['seed'] = list(self.seed) if isinstance(self.seed, (tuple, list)) else self.seed
+        return config
+
+    # Computes the positions of an array of ids (np.uint64) as a (N, nhash)
+    # array: the nth position is the high word of mix64(state + n*GOLDEN64)
+    # times k, with the state of the id given by the seed
+    def indices_many(self, ids):
+        state = mix64_array(ids ^ np.uint64(self.key))
+        indices = np.empty((ids.shape[0], self.nhash), dtype=np.int64)
+        for n in range(self.nhash):
+            word = mix64_array(state + np.uint64(((n + 1) * GOLDEN64) & MASK64))
+            if self.m < (1 << 32):
+                indices[:, n] = mulhi64(word, self.m)
+            else:
+                # larger sizes are powers of two (see GenericHashFunctions)
+                indices[:, n] = word >> np.uint64(64 - self.bitidx_size)
+        return indices
+
+    # Retrieves the (block_size, nhash) array of positions of a block of ids
+    def get_block(self, block):
+        positions = self.blocks.get(block)
+        if positions is None:
+            start = block * self.block_size
+            positions = self.indices_many(np.arange(start, start + self.block_size, dtype=np.uint64))
+            if len(self.blocks) >= self.max_blocks:
+                # forget the oldest block
+                del self.blocks[next(iter(self.blocks))]
+            self.blocks[block] = positions
+        return positions
+
+    # The "digest" of an element is just its integer id
+    def digest(self, key):
+        return self.decode_int(key)
+
+    # Retrieves the positions drawn for the id
+    def digest_indices(self, value):
+        value &= MASK64
+        if self.max_blocks > 0:
+            return tuple(self.get_block(value // self.block_size)[value % self.block_size].tolist())
+        state = mix64(value ^ self.key)
+        m = self.m
+        return tuple((mix64((state + (n + 1) * GOLDEN64) & MASK64) * m) >> 64 for n in range(self.nhash))
+
+    # Retrieves the positions of a sequence of ids as a (N, nhash) array
+    def hash_many(self, elements, key_width=None):
+        ids = self.decode_int_many(elements, key_width)
+        if ids.shape[0] == 0 or self.max_blocks == 0:
+            return self.indices_many(ids)
+        # group the ids by block and copy the positions block by block
+        block_ids = ids // np.uint64(self.block_size)
+        if np.all(block_ids[1:] >= block_ids[:-1]):
+            # ranges of ids are already grouped
+            order = np.arange(ids.shape[0])
+        else:
+            order = np.argsort(block_ids, kind='stable')
+        blocks, starts = np.unique(block_ids[order], return_index=True)
+        ends = np.append(starts[1:], ids.shape[0])
+        indices = np.empty((ids.shape[0], self.nhash), dtype=np.int64)
+        for block, start, end in zip(blocks.tolist(), starts.tolist(), ends.tolist()):
+            rows = order[start:end]
+            indices[rows] = self.get_block(block)[ids[rows] % np.uint64(self.block_size)]
+        return indices
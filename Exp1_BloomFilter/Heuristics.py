@@ -20,8 +20,8 @@ def h_number_of_neighbours(bf, p, tp, e, n):
     heuristics = {}
     for element in list(p):
         value = 0
-        for i in range(bf.nhash):
-            value += len(e[bf.get_hash().getbit_idx(element, i)]) - 1
+        for idx in bf.get_hash().get_indices(element):
+            value += len(e[idx]) - 1
         heuristics[element] = value
     # We sort them and get the n-len(tp) elements with less heuristic that will be the predicted tp by the heuristic
     sorted_elements = sorted(heuristics, key=heuristics.get)
@@ -169,8 +169,8 @@ def h_number_of_tp_with_neighbours(bf, p, tp, e, n):
         heuristics_1 = {}
         for element in to_be_fp:
             value = 0
-            for i in range(bf.nhash):
-                value += len(original_e[bf.get_hash().getbit_idx(element, i)]) - 1
+            for idx in bf.get_hash().get_indices(element):
+                value += len(original_e[idx]) - 1
             heuristics_1[element] = value
         to_be_fp = [sorted(heuristics_1, key=heuristics_1.get)[0]]
         for fp in to_be_fp:
@@ -0,0 +1,76 @@
+import argparse
+import json
+
+import numpy as np
+
+from GenericHashFunctions import BATCH_SIZE
+from HashBackends import HASH_BACKENDS, make_hash
+
+# Precomputed bit indices of a whole universe of integer elements (0 to
+# max_val) for a fixed hash configuration. The (max_val+1, nhash) array is
+# stored as a .npy file that is memory-mapped when loaded, and the
+# configuration of the hash object is stored next to it in a .json file
+
+
+# Name of the file with the configuration of the table stored in path
+def config_path(path):
+    return path + '.json'
+
+
+# Computes the bit indices of the elements 0 to max_val with the hash
+# object hashf and stores them in the file path. Returns the mapped table
+def build_index_table(hashf, max_val, path, chunk=BATCH_SIZE):
+    # smaller integers are enough for the positions of most filters
+    dtype = np.uint32 if hashf.m <= (1 << 32) else np.int64
+    table = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=(max_val + 1, hashf.nhash))
+    for start in range(0, max_val + 1, chunk):
+        end = min(start + chunk, max_val + 1)
+        table[start:end] = hashf.hash_many(np.arange(start, end))
+    table.flush()
+    config = hashf.get_config()
+    config['max_val'] = max_val
+    with open(config_path(path), 'w') as f:
+        json.dump(config, f)
+    return table
+
+
+# Loads the table stored in path without reading it (memory-mapped).
+# When hashf is given, it checks that the table was built with an
+# equivalent hash object
+def load_index_table(path, hashf=None):
+    with open(config_path(path)) as f:
+        config = json.load(f)
+    config.pop('max_val')
+    if hashf is not None and hashf.get_config() != json.loads(json.dumps(config)):
+        raise ValueError("The index table " + path + " was built with a different hash: " + str(config))
+    return np.load(path, mmap_mode='r')
+
+
+# Function to find all elements from the universe that returns a positive from the filter
+# using a precomputed table instead of hashing them
+# bf is the filter, which must use the hash of the table
+# table is the index table of the universe, from 0 to max_val
+# max_val is the maximum integer value (the whole table by default)
+def find_p_table(bf, table, max_val=None, chunk=BATCH_SIZE):
+    if max_val is None:
+        max_val = table.shape[0] - 1
+    p = list()
+    for start in range(0, max_val + 1, chunk):
+        end = min(start + chunk, max_val + 1)
+        # the filter checks the indices itself, so the elements without
+        # positions (see the d-left filter) are negatives
+        positive = bf.check_indices(table[start:end].astype(np.int64), 1)
+        p.extend((np.flatnonzero(positive) + start).tolist())
+    return p
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Precompute the bit indices of a universe of integers")
+    parser.add_argument("-m", dest="m", type=int, help="Filter size (default 1024)", default=1024)
+    parser.add_argument("-k", dest="k", type=int, help="Number of hashes (default 3)", default=3)
+    parser.add_argument("-u", dest="max_val", type=int, help="Maximum element of the universe (default 1000000)", default=1000000)
+    parser.add_argument("-H", dest="hash", choices=sorted(HASH_BACKENDS), help="Hash backend (default md5)", default="md5")
+    parser.add_argument("-D", dest="double_hashing", action="store_true", help="Derive the hashes with double hashing")
+    parser.add_argument("-o", dest="path", help="Output file (default universe.npy)", default="universe.npy")
+    args = parser.parse_args()
+    build_index_table(make_hash(args.hash, args.m, args.k, double_hashing=args.double_hashing), args.max_val, args.path)
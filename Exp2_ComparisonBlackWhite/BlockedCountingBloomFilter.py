@@ -0,0 +1,81 @@
+import numpy as np
+
+from CounterStorage import RAISE, UINT4
+from CountingBloomFilter import CountingBloomFilter
+
+# size in bytes of the blocks of counters, the size of a cache line
+BLOCK_BYTES = 64
+
+
+# Number of counters of the storage given by dtype that fit in a block. The
+# list of ints is taken as 8 bit counters, as the uint8 array
+def block_counters(dtype=None):
+    if dtype is None:
+        return BLOCK_BYTES
+    if dtype == UINT4:
+        return BLOCK_BYTES * 2
+    return BLOCK_BYTES // np.dtype(dtype).itemsize
+
+
+# Blocked counting bloom filter: the counters are split in blocks of
+# block_size counters (a cache line by default) and the k positions of an
+# element are always in the same block. The hash gives k+1 indices: the
+# first one selects the block and the other ones the offsets in the block.
+# As in CountingBloomFilterNoCol, the k positions of an element are always
+# different: an offset already used by the element moves to the next
+# counter of the block
+class BlockedCountingBloomFilter(CountingBloomFilter):
+
+    def __init__(self, m=65536, nhash=5, hash_f=None, dtype=None, overflow=RAISE, block_size=None):
+        # the hash has an extra index for the block (see hash_count)
+        CountingBloomFilter.__init__(self, m, nhash, hash_f, dtype, overflow)
+        # number of counters of each block
+        self.block_size = block_counters(dtype) if block_size is None else block_size
+        assert m % self.block_size == 0 and nhash <= self.block_size
+        # indices and positions of the last element
+        self.lastindices = None
+        self.lastpositions = None
+
+    # Number of indices that the hash must give for nhash positions
+    @staticmethod
+    def hash_count(nhash):
+        return nhash + 1
+
+    # Retrieve the parameters of the filter
+    def get_config(self):
+        config = CountingBloomFilter.get_config(self)
+        config['block_size'] = self.block_size
+        return config
+
+    # Retrieve the positions of the counters assigned to the element, all of
+    # them in the block given by the first index
+    def get_positions(self, data):
+        indices = self.hash.get_indices(data)
+        if indices is self.lastindices:
+            return self.lastpositions
+        size = self.block_size
+        start = indices[0] - indices[0] % size
+        offsets = []
+        for idx in indices[1:]:
+            offset = idx % size
+            while offset in offsets:
+                offset = (offset + 1) % size
+            offsets.append(offset)
+        self.lastindices = indices
+        self.lastpositions = [start + offset for offset in offsets]
+        return self.lastpositions
+
+    # Retrieve the positions of the counters for a (N, nhash+1) matrix with
+    # the indices of N elements, solving the repeated offsets of each
+    # element column by column as in CountingBloomFilterNoCol
+    def positions_from_indices(self, indices):
+        indices = np.asarray(indices, dtype=np.int64).reshape(-1, self.nhash + 1)
+        size = self.block_size
+        offsets = indices[:, 1:] % size
+        for n in range(1, self.nhash):
+            rows = np.arange(offsets.shape[0])
+            while rows.shape[0] > 0:
+                column = offsets[rows, n]
+                rows = rows[(offsets[rows, :n] == column[:, None]).any(axis=1)]
+                offsets[rows, n] = (offsets[rows, n] + 1) % size
+        return offsets + (indices[:, :1] - indices[:, :1] % size)
@@ -1,10 +1,18 @@
 import random
+import numpy as np
 import sys
 import getopt
 from CountingBloomFilterNoCol import CountingBloomFilterNoCol
+from BlockedCountingBloomFilter import BlockedCountingBloomFilter
+from PartitionedCountingBloomFilter import PartitionedCountingBloomFilter
+from HashBackends import HASH_BACKENDS, make_hash
+from UniverseIndexTable import find_p_table
+from GenericHashFunctions import BATCH_SIZE, KEY_ENCODINGS
+from CounterStorage import COUNTER_DTYPES, OVERFLOW_POLICIES
 from GenericHashFunctionsSHA512 import GenericHashFunctionsSHA512
 import time
 import argparse
+from collections import OrderedDict
 
 # Testing parameters
 # filter_size = 1024
@@ -12,17 +20,44 @@ import argparse
 # n = 175
 # trials = 100
 max_val = 1000000000
+# maximum number of results kept by the memo of removal_impact (see memo_removal_impact)
+MEMO_SIZE = 4096
+
+# Counting filter variants that can be selected with -F. All of them give
+# k different positions to each element
+FILTERS = {
+    'nocol': CountingBloomFilterNoCol,
+    'blocked': BlockedCountingBloomFilter,
+    'partitioned': PartitionedCountingBloomFilter,
+}
 
 parser = argparse.ArgumentParser()
 parser.add_argument("-m", dest="m", type=int, help="Filter size (default 1024)", default=1024)
 parser.add_argument("-n", dest="n", type=int, help="Number of true positives (default 256)", default=256)
 parser.add_argument("-t", dest="t", type=int, help="Number of iterations (default 10)", default=10)
 parser.add_argument("-k", dest="k", type=int, help="Number of hashes (default 3)", default=3)
+parser.add_argument("-c", dest="c", type=int, help="Size of the LRU cache of hash indices (default 0 - disabled)", default=0)
+parser.add_argument("-H", dest="hash", choices=sorted(HASH_BACKENDS), help="Hash backend (default md5)", default="md5")
+parser.add_argument("-d", dest="digest_size", type=int, help="Digest size in bytes of the blake2b backend (default 16)", default=16)
+parser.add_argument("-D", dest="double_hashing", action="store_true", help="Derive the hashes with double hashing (h1 + i*h2) instead of splitting the digest")
+parser.add_argument("-e", dest="key_encoding", choices=KEY_ENCODINGS, help="Encoding of the elements before hashing them (default str)", default="str")
+parser.add_argument("-s", dest="seed", type=int, help="Seed of the oracle hash backend, combined with the trial (default 0)", default=0)
+parser.add_argument("-C", dest="dtype", choices=COUNTER_DTYPES, help="Store the counters in a numpy array of this dtype, or packed in 4 bits with uint4 (default a list of ints)", default=None)
+parser.add_argument("-O", dest="overflow", choices=OVERFLOW_POLICIES, help="What to do when a counter of the array is full (default raise)", default="raise")
+parser.add_argument("-F", dest="filter", choices=sorted(FILTERS), help="Collision-free counting filter variant (default nocol)", default="nocol")
 args = parser.parse_args()
 filter_size = args.m
 n = args.n
 trials = args.t
 k = args.k
+cache_size = args.c
+hash_name = args.hash
+hash_params = {'digest_size': args.digest_size} if hash_name == 'blake2b' else {}
+hash_params['double_hashing'] = args.double_hashing
+hash_params['key_encoding'] = args.key_encoding
+counter_dtype = args.dtype
+counter_overflow = args.overflow
+filter_class = FILTERS[args.filter]
 pairs = 1
 
 # Function to generate the random set of elements.
@@ -41,6 +76,7 @@ def generate_random_elements(num, bf=None, ds=None, max_val=1000000000, exclude=
 
     # Keeps data of stored elements
     stored = 0
+    entries = []
     # Generate elements until the value "stored" is reached
     while stored < num:
         # Generate integers between 1 and max_val
@@ -49,10 +85,8 @@ def generate_random_elements(num, bf=None, ds=None, max_val=1000000000, exclude=
         # go to next iteration
         if entry in s or entry in exclude:
             continue
-        # When an BloomFilter is received
-        if bf is not None:
-            # Add the entry to the filter
-            bf.add(entry)
+        # Keep the entry to add it to the filter
+        entries.append(entry)
         # When a list is received
         if ds is not None:
             # Add the element to the list
@@ -61,6 +95,9 @@ def generate_random_elements(num, bf=None, ds=None, max_val=1000000000, exclude=
         stored = stored + 1
         # Add it to the set so they are not repeated
         s.add(entry)
+    # When a filter is received, all the entries are added to it in a single batch
+    if bf is not None:
+        bf.add_many(entries)
     return
 
 # Function to generate a random set of false positives
@@ -98,15 +135,20 @@ def generate_random_fp(num, bf, max_val=1000000000, exclude=None):
 # Function to find all elements from the universe that returns a positive from CBF
 # bf is the Counting Bloom Filter
 # max_val is the maximum integer value. Universe will include elements from 1 to max_val
-def find_p(bf, max_val):
+# table is an optional index table of the universe precomputed with the hash of bf
+# (see UniverseIndexTable), so the elements are not hashed again
+def find_p(bf, max_val, table=None):
+    if table is not None:
+        return find_p_table(bf, table, max_val)
     # Create the list P of (true and false) positive elements
     p = list()
-    # Check all elements of the universe, from 1 to max_val
-    for i in range(max_val+1):
+    # Check all elements of the universe, from 1 to max_val, by batches
+    for start in range(0, max_val+1, BATCH_SIZE):
+        batch = range(start, min(start + BATCH_SIZE, max_val+1))
         # If one of the positions is 0, then it is a negative
         # Otherwise, add it to P
-        if bf.check(i, 1):
-            p.append(i)
+        positive = bf.check_many(batch, 1)
+        p.extend(batch[i] for i in np.flatnonzero(positive).tolist())
 
     return p
 
@@ -116,12 +158,14 @@ def find_p(bf, max_val):
 def find_p_set(bf, set):
     # Create the list P of (true and false) positive elements
     p = list()
-    # Check all elements of the set
-    for element in set:
+    # Check all elements of the set in a single batch
+    elements = list(set)
+    positive = bf.check_many(elements, 1).tolist()
+    for i in range(len(elements)):
         # If one of the positions is 0, then it is a negative
         # Otherwise, add it to P
-        if bf.check(element, 1):
-            p.append(element)
+        if positive[i]:
+            p.append(elements[i])
 
     return p
 
@@ -131,11 +175,10 @@ def find_p_set(bf, set):
 # positives is the list of elements to be removed
 # count_cbf is the list of counters from the CBF
 # count is the list of counters from T
-# hashf is the hash function used in the CBF
+# positions maps every element of T to the positions of its counters (see peeling)
 # k is the number of positions
 # is_positive indicates if it is a real positive (true) or a false positive (false)
-# nocol is a boolean indicating whether no collision is activated or not
-def clear_positions(m, elements, positives, count_cbf, count, hashf, k, is_positive, nocol):
+def clear_positions(m, elements, positives, count_cbf, count, positions, k, is_positive):
     # Additional elements to be removed
     additional = list()
     # and iterate over them
@@ -145,15 +188,8 @@ def clear_positions(m, elements, positives, count_cbf, count, hashf, k, is_posit
     for i in range(num):
         # get next element to be removed
         next_positive = positives[i]
-        # for the k hash functions
-        hashes = []
-        for j in range(k):
-            # Get the position mapped for the element and the jth hash function
-            jpos = hashf.getbit_idx(next_positive, j)
-            if nocol:
-                while jpos in hashes:
-                    jpos = (jpos + 1) % m
-                hashes.append(jpos)
+        # for the k positions of the element
+        for jpos in positions[next_positive]:
             # Element might have been removed in a different level of recursion
             if elements[jpos].count(next_positive) == 0:
                 break
@@ -173,7 +209,7 @@ def clear_positions(m, elements, positives, count_cbf, count, hashf, k, is_posit
     # Recursive call to remove the false positive elements
     if len(additional) > 0:
         # Pass False as last parameter as they are false positives
-        clear_positions(m, elements, additional, count_cbf, count, hashf, k, False, nocol)
+        clear_positions(m, elements, additional, count_cbf, count, positions, k, False)
 
     return
 
@@ -192,18 +228,17 @@ def peeling(m, k, cbf, p, nocol):
     # Count of elements mapped to each position
     count = [0] * m
 
+    # Positions of all the elements in p, hashed in a single batch
+    indices = hashf.hash_many(p)
+    # If no collision is activated, the filter solves the repeated positions of every element
+    if nocol:
+        indices = cbf.positions_from_indices(indices)
+    # Positions of each element, used again when the elements are removed
+    positions = dict(zip(p, indices.tolist()))
     # For all the positions in p
     for i in range(len(p)):
-        hashes = []
-        # for the k hash functions
-        for j in range(k):
-            # Get the position mapped for the element p[i] and the jth hash function
-            pos = hashf.getbit_idx(p[i], j)
-            # If no collision is activated, we recalculate the value of the hash
-            if nocol:
-                while pos in hashes:
-                    pos = (pos + 1) % m
-                hashes.append(pos)
+        # for the positions of the k hash functions
+        for pos in positions[p[i]]:
             # Retrieve the position pos of the T array
             list_pos = elements[pos]
             # If no elements are assigned to that position, create a list and assign it
@@ -217,8 +252,10 @@ def peeling(m, k, cbf, p, nocol):
 
     # Set that will store the positives that were extracted from the filter
     positives = set()
-    # Values for the CBF counters
-    counters = cbf.get_counters()
+    # Values for the CBF counters, unpacked in a list of ints whatever their
+    # storage (see CounterStorage), so each counter is read fast by the loop.
+    # It is a copy, the counters of the filter are not changed by the peeling
+    counters = np.asarray(cbf.get_counters()).tolist()
 
     while True:
         # If we found an element that could be extracted in this iteration
@@ -242,7 +279,7 @@ def peeling(m, k, cbf, p, nocol):
             removers = elements[i].copy()
             # call the function that clears the removers and related false positives
             # pass True as last parameter as they are real positives
-            clear_positions(m, elements, removers, counters, count, hashf, k, True, nocol)
+            clear_positions(m, elements, removers, counters, count, positions, k, True)
         # if no new positives were found in the iteration, we should finish the algorithm
         if not found:
             break
@@ -250,20 +287,45 @@ def peeling(m, k, cbf, p, nocol):
     # return elements that were retrieved from the CBF
     return positives
 
+# Function that retrieves the positives that would be rejected if the element
+# were removed (see removal_impact), remembering the results of the last
+# MEMO_SIZE questions. The states of the filter are told apart by the
+# fingerprint of the counters (see track_fingerprint), so the same question
+# after the filter returns to an earlier state is answered from memo, while
+# the results of the states left behind are evicted
+# element is the element to be removed
+# bf is the Counting Bloom Filter
+# candidates is the set of positives that are checked
+# index maps every position to the positives that use it (see candidate_index)
+# memo is the LRU OrderedDict with the results, kept for all the positives of index
+def memo_removal_impact(element, bf, candidates, index, memo):
+    key = (bf.fingerprint, element)
+    impact = memo.get(key)
+    if impact is not None:
+        # mark the result as the most recently used one
+        memo.move_to_end(key)
+    else:
+        impact = bf.removal_impact(element, None, index)
+        memo[key] = impact
+        if len(memo) > MEMO_SIZE:
+            memo.popitem(last=False)
+    return impact & candidates
+
 # Function that decides whether a posible true positive (by removing it and doing
 # some checkings with the rest of the positives) is really a true positive or unknown
 # Returns True when it is a tp, False if unknown
 # element is the element to be tested
 # bf is the Counting Bloom Filter
 # positives_set is the set of all positives accepted by the filter
-def test_element(element, bf, positives_set, removals):
-    # We remove the element to be tested
-    bf.remove(element)
-    # And obtain the difference between the original positives and the new ones
-    new_positives = set(find_p_set(bf, list(positives_set)))
-    diff = positives_set - new_positives
+# index maps every position to the positives that use it (see candidate_index)
+# memo keeps the positives lost by removals (see memo_removal_impact)
+def test_element(element, bf, positives_set, removals, index, memo):
+    # We obtain the difference between the original positives and the ones left
+    # if the element to be tested is removed, without removing it yet
+    diff = memo_removal_impact(element, bf, positives_set, index, memo)
     # If the only difference is the element itself, it is a true positive
     if len(diff) == 1:
+        bf.remove(element)
         removals.add(element)
         positives_set = positives_set - {element}
         return True
@@ -271,33 +333,34 @@ def test_element(element, bf, positives_set, removals):
     # from the filter not taking the element itself into account
     elif len(diff) > 1:
         diff = diff - {element}
-        temp_added = []
+        # The element is removed and the other ones are added temporarily in
+        # transactions, so the changes can be undone
+        bf.begin()
+        bf.remove(element)
+        bf.begin()
         for e in list(diff):
             bf.add(e)
-            temp_added.append(e)
             # If it's not in the filter, then we have a hash collision
             if not bf.check(e):
-                for r in temp_added:
-                    bf.remove(r)
-                bf.add(element)
+                bf.rollback()
+                bf.rollback()
                 return False
         # If x isn't in the filter, then it is a true positive
         if not bf.check(element):
+            bf.rollback()
+            bf.commit()
             for e in list(diff):
-                bf.remove(e)
                 removals.add(e)
                 positives_set = positives_set - {e}
             removals.add(element)
             positives_set = positives_set - {element}
             return True
         # If it is in the filter, we can't say it is a TP for sure
-        for e in list(diff):
-            bf.remove(e)
-        bf.add(element)
+        bf.rollback()
+        bf.rollback()
         return False
     # Otherwise, we can't decide whether it is a true positive or a false one
     else:
-        bf.add(element)
         return False
 
 # Function that decides whether a pair of posible true positives (by removing it and doing
@@ -307,31 +370,25 @@ def test_element(element, bf, positives_set, removals):
 # pos2 is the second element of the pair
 # bf is the Counting Bloom Filter
 # positives_set is the set of all positives accepted by the filter
-def test_pairs(pos1, pos2, bf, positives_set, removals):
-    # We remove the pair of elements to be tested
-    bf.remove(pos1)
+# index maps every position to the positives that use it (see candidate_index)
+# memo keeps the positives lost by removals (see memo_removal_impact)
+def test_pairs(pos1, pos2, bf, positives_set, removals, index, memo):
     # If pos2 is negative after we remove pos1 it is not useful for us
-    if not bf.check(pos2):
-        bf.add(pos1)
+    if memo_removal_impact(pos1, bf, {pos2}, index, memo):
         return False
     # We also check the reciprocal
-    bf.add(pos1)
-    bf.remove(pos2)
-    if not bf.check(pos1):
-        bf.add(pos2)
+    if memo_removal_impact(pos2, bf, {pos1}, index, memo):
         return False
-    bf.remove(pos1)
-    # Check that both a now negatives
-    if  bf.check(pos1) or bf.check(pos2):
-        bf.add(pos1)
-        bf.add(pos2)
+    # Check that both are negatives after removing the pair
+    if len(bf.removal_impact((pos1, pos2), {pos1, pos2}, index)) < 2:
         return False
 
     # And obtain the difference between the original positives and the new ones
-    new_positives = set(find_p_set(bf, list(positives_set)))
-    diff = positives_set - new_positives
+    diff = bf.removal_impact((pos1, pos2), positives_set, index)
     # If the only difference is the pair of elements, they are true positives
     if len(diff) == 2:
+        bf.remove(pos1)
+        bf.remove(pos2)
         removals.add(pos1)
         removals.add(pos2)
         return True
@@ -340,34 +397,33 @@ def test_pairs(pos1, pos2, bf, positives_set, removals):
     elif len(diff) > 2:
         diff = diff - {pos1}
         diff = diff - {pos2}
-        temp_added = []
+        # The pair is removed and the other ones are added temporarily in
+        # transactions, so the changes can be undone
+        bf.begin()
+        bf.remove(pos1)
+        bf.remove(pos2)
+        bf.begin()
         for e in list(diff):
             bf.add(e)
-            temp_added.append(e)
             if not bf.check(e):
-                for r in temp_added:
-                    bf.remove(r)
-                bf.add(pos1)
-                bf.add(pos2)
+                bf.rollback()
+                bf.rollback()
                 return False
         # If the pair isn't in the filter, then it is a true positive
         if not bf.check(pos1) and not bf.check(pos2):
+            bf.rollback()
+            bf.commit()
             for e in list(diff):
-                bf.remove(e)
                 removals.add(e)
             removals.add(pos1)
             removals.add(pos2)
             return True
         # If one of them is in the filter, we can't say it is a TP for sure
-        for e in list(diff):
-            bf.remove(e)
-        bf.add(pos1)
-        bf.add(pos2)
+        bf.rollback()
+        bf.rollback()
         return False
     # Otherwise, we can't decide whether they are tp or fp
     else:
-        bf.add(pos1)
-        bf.add(pos2)
         return False
 
 x_axis = []
@@ -387,12 +443,17 @@ for fals in dots:
     worst_blackbox_pairs = 100
     avg_whitebox = 0
     worst_whitebox = 100
-    for _ in range(trials):
+    cache_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+    for trial in range(trials):
         # First we proceed with the blackbox analysis
 
         # Generate a standard CBF with the testing parameters
         # We create a no colision CBF since we are performing pair extraction
-        bf = CountingBloomFilterNoCol(filter_size, k)
+        if hash_name == 'oracle':
+            # the oracle positions are drawn again for every trial
+            hash_params['seed'] = (args.seed, fals, trial)
+        hashf = make_hash(hash_name, filter_size, filter_class.hash_count(k), cache_size=cache_size, **hash_params)
+        bf = filter_class(filter_size, k, hashf, counter_dtype, counter_overflow)
 
         # Fill the filter with random elements
         true_positives = []
@@ -405,6 +466,13 @@ for fals in dots:
         # Run the algorithm
         all_positives = true_positives + false_positives
         all_positives_set = set(all_positives)
+        # The positives lost when some elements are removed are found from the
+        # positives that use the counters that would drop to 0
+        index = bf.candidate_index(all_positives)
+        # The filter keeps going back to the same states after the temporary
+        # changes of the tests, so the positives lost are remembered by state
+        bf.track_fingerprint()
+        memo = OrderedDict()
         found_tps = []
         new_tp_found = True
         # We try to extract elements with the algorithm one by one
@@ -416,7 +484,7 @@ for fals in dots:
                 # If we have already removed a tp or fp, we don't take it into account
                 if pos in removals:
                     continue
-                if test_element(pos, bf, all_positives_set_temp, removals):
+                if test_element(pos, bf, all_positives_set_temp, removals, index, memo):
                     found_tps.append(pos)
                     new_tp_found = True
                     all_positives_set_temp = all_positives_set - removals
@@ -442,7 +510,7 @@ for fals in dots:
                         # If we have already removed a tp or fp, we don't take it into account
                         if pos1 in removals or pos2 in removals:
                             continue
-                        if test_pairs(pos1, pos2, bf, all_positives_set_temp, removals):
+                        if test_pairs(pos1, pos2, bf, all_positives_set_temp, removals, index, memo):
                             found_tps_with_pairs.append(pos1)
                             found_tps_with_pairs.append(pos2)
                             new_tp_found = True
@@ -462,7 +530,7 @@ for fals in dots:
                         # If we have already removed a tp or fp, we don't take it into account
                         if pos in removals:
                             continue
-                        if test_element(pos, bf, all_positives_set_temp, removals):
+                        if test_element(pos, bf, all_positives_set_temp, removals, index, memo):
                             found_tps_with_pairs.append(pos)
                             new_tp_found = True
                             all_positives_set_temp = all_positives_set - removals
@@ -491,11 +559,14 @@ for fals in dots:
             if prct_obtained_pairs < worst_blackbox_pairs:
                 worst_blackbox_pairs = prct_obtained_pairs
 
+        # Keep the statistics of the cache used in the blackbox analysis
+        for stat in cache_stats:
+            cache_stats[stat] += hashf.get_cache_stats()[stat]
+
         # Then, we carry out the whitebox analysis
         # Generate a new CBF with the same data
-        bf = CountingBloomFilterNoCol(filter_size, k)
-        for posit in true_positives:
-            bf.add(posit)
+        bf = filter_class(filter_size, k, hashf, counter_dtype, counter_overflow)
+        bf.add_many(true_positives)
         found_tps = peeling(filter_size, k, bf, all_positives, pairs)
         prct_obtained = (len(found_tps)/len(true_positives)) * 100
         avg_whitebox += prct_obtained/trials
@@ -519,6 +590,8 @@ for fals in dots:
             exit(0)
 
     print("Tested with " + str(fals) + " false positives")
+    if cache_size > 0:
+        print("Cache hits:", cache_stats['hits'], "Cache misses:", cache_stats['misses'], "Cache evictions:", cache_stats['evictions'])
 
 print("Blackbox with pairs and whitebox limited to two elements have extracted the same elements.")
 
@@ -0,0 +1,66 @@
+import math
+
+import numpy as np
+
+from GenericHashFunctions import GenericHashFunctions, STR_KEYS, index_width
+
+MASK64 = (1 << 64) - 1
+# increment of the splitmix64 generator (golden ratio)
+GOLDEN64 = 0x9E3779B97F4A7C15
+
+
+# splitmix64 finaliser, mixes a 64 bit integer
+def mix64(z):
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & MASK64
+    return z ^ (z >> 31)
+
+
+# Same finaliser for an array of np.uint64 (multiplications wrap around)
+def mix64_array(z):
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+# Non-cryptographic hash for integer elements. The digest is built with as
+# many 64 bit words of the splitmix64 sequence seeded with the element as
+# needed for the nhash bit indices, so no hashlib call is made at all
+class GenericHashFunctionsSplitMix64(GenericHashFunctions):
+
+    def __init__(self, k=1024, nhash=2, cache_size=0, double_hashing=False, key_encoding=STR_KEYS, seed=0):
+        # the seed selects a different family of hash functions
+        self.seed = seed
+        self.seed_mix = mix64(seed & MASK64)
+        # number of 64 bit words needed for all the bit indices
+        # (two words, h1 and h2, with double hashing)
+        if double_hashing:
+            self.words = 2
+        else:
+            self.words = max(1, math.ceil(nhash * index_width(k) / 64))
+        GenericHashFunctions.__init__(self, None, 64 * self.words, k, nhash, cache_size, double_hashing,
+                                      key_encoding)
+        return
+
+    # Retrieves the parameters of the object, including the seed
+    def get_config(self):
+        config = GenericHashFunctions.get_config(self)
+        config['seed'] = self.seed
+        return config
+
+    # Calculates the digest of the key of an integer element
+    def digest(self, key):
+        state = (self.decode_int(key) & MASK64) ^ self.seed_mix
+        value = 0
+        for w in range(1, self.words + 1):
+            value = (value << 64) | mix64((state + w * GOLDEN64) & MASK64)
+        return value
+
+    # Retrieves the bit indices of all the hashes for a sequence of integer
+    # elements, calculating all the words of the digests with numpy
+    def hash_many(self, elements, key_width=None):
+        state = self.decode_int_many(elements, key_width) ^ np.uint64(self.seed_mix)
+        words = np.empty((state.shape[0], self.words), dtype='>u8')
+        for w in range(1, self.words + 1):
+            words[:, w - 1] = mix64_array(state + np.uint64((w * GOLDEN64) & MASK64))
+        return self.digests_indices(words.view(np.uint8))
@@ -0,0 +1,32 @@
+import numpy as np
+
+from CounterStorage import RAISE
+from CountingBloomFilter import CountingBloomFilter
+
+
+# Partitioned counting bloom filter: the counters are split in nhash slices
+# of m // nhash counters and the nth hash only gives positions of the nth
+# slice, so the k positions of an element are always different without
+# probing. The hash indices in [0, m) are reduced to a slice with a
+# multiplication and a division, (idx * size) // m
+class PartitionedCountingBloomFilter(CountingBloomFilter):
+
+    def __init__(self, m=65536, nhash=5, hash_f=None, dtype=None, overflow=RAISE):
+        CountingBloomFilter.__init__(self, m, nhash, hash_f, dtype, overflow)
+        # number of counters of each slice (the last m % nhash are not used)
+        self.slice_size = m // nhash
+        assert self.slice_size > 0
+
+    # Retrieve the positions of the counters assigned to the element, one
+    # in each slice
+    def get_positions(self, data):
+        size = self.slice_size
+        m = self.m
+        return [n * size + (idx * size) // m for n, idx in enumerate(self.hash.get_indices(data))]
+
+    # Retrieve the positions of the counters for a (N, nhash) matrix with
+    # the bit indices of N elements
+    def positions_from_indices(self, indices):
+        indices = np.asarray(indices, dtype=np.int64).reshape(-1, self.nhash)
+        starts = np.arange(self.nhash, dtype=np.int64) * self.slice_size
+        return starts + (indices * self.slice_size) // self.m
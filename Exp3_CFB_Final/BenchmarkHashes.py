@@ -0,0 +1,33 @@
+import argparse
+import time
+
+from HashBackends import HASH_BACKENDS, make_hash
+from GenericHashFunctions import KEY_ENCODINGS
+
+# Measures how many bit indices per second each hash backend produces, both
+# element by element (get_indices) and in batches (hash_many)
+parser = argparse.ArgumentParser()
+parser.add_argument("-m", dest="m", type=int, help="Filter size (default 1024)", default=1024)
+parser.add_argument("-k", dest="k", type=int, help="Number of hashes (default 3)", default=3)
+parser.add_argument("-N", dest="N", type=int, help="Number of elements hashed (default 200000)", default=200000)
+parser.add_argument("-d", dest="digest_size", type=int, help="Digest size in bytes of the blake2b backend (default 16)", default=16)
+parser.add_argument("-e", dest="key_encoding", choices=KEY_ENCODINGS, help="Encoding of the elements before hashing them (default str)", default="str")
+args = parser.parse_args()
+
+elements = list(range(1, args.N + 1))
+for name in HASH_BACKENDS:
+    params = {'digest_size': args.digest_size} if name == 'blake2b' else {}
+    params['key_encoding'] = args.key_encoding
+    hashf = make_hash(name, args.m, args.k, **params)
+
+    start = time.perf_counter()
+    for element in elements:
+        hashf.get_indices(element)
+    scalar = time.perf_counter() - start
+
+    start = time.perf_counter()
+    hashf.hash_many(elements)
+    batch = time.perf_counter() - start
+
+    print("%-10s get_indices: %12.0f indices/s   hash_many: %12.0f indices/s"
+          % (name, args.N * args.k / scalar, args.N * args.k / batch))
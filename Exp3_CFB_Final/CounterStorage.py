@@ -0,0 +1,88 @@
+from operator import itemgetter
+
+import numpy as np
+
+from NibbleCounters import NibbleCounters, NIBBLE_MAX
+
+# Storage of the counters of the counting filters. By default (dtype None)
+# the counters are a list of Python ints, as in the original code, which
+# never overflow. With one of these dtypes they are kept in a numpy array
+# instead, using 1, 2 or 4 bytes for each counter, or packed in 4 bits
+# each with uint4 (see NibbleCounters)
+UINT4 = 'uint4'
+COUNTER_DTYPES = (UINT4, 'uint8', 'uint16', 'uint32')
+
+# What happens when a counter of an array is full and it must be increased
+# raise: an OverflowError is raised and the filter is left unchanged
+# saturate: the counter stays at its maximum value. It is not decreased
+# either, since the number of elements mapped to it is not known anymore
+RAISE = 'raise'
+SATURATE = 'saturate'
+OVERFLOW_POLICIES = (RAISE, SATURATE)
+
+
+# Creates m counters set to 0 with the storage given by dtype
+def new_counters(m, dtype=None):
+    if dtype is None:
+        return [0] * m
+    if dtype == UINT4:
+        return NibbleCounters(m)
+    assert dtype in COUNTER_DTYPES
+    return np.zeros(m, dtype=dtype)
+
+
+# Maximum value of a counter with the storage given by dtype (None when the
+# counters have no limit)
+def max_count(dtype=None):
+    if dtype is None:
+        return None
+    if dtype == UINT4:
+        return NIBBLE_MAX
+    return int(np.iinfo(dtype).max)
+
+
+# Sets all the counters to 0 without creating a new list or array, so the
+# references returned by get_counters are still valid
+def clear_counters(counters):
+    if isinstance(counters, list):
+        counters[:] = [0] * len(counters)
+    else:
+        counters.fill(0)
+    return
+
+
+# Number of bytes taken by the counters. The list of ints is counted as a
+# pointer (8 bytes) for each counter, the small ints are shared objects
+def storage_bytes(counters):
+    if isinstance(counters, list):
+        return 8 * len(counters)
+    if hasattr(counters, 'words'):
+        # packed counters (see NibbleCounters)
+        return counters.words.nbytes
+    return counters.nbytes
+
+
+# Reads the counters at an array of positions as an array of np.int64 with
+# the same shape. A list of ints is only converted as a whole when there are
+# as many positions as counters, otherwise the counters are taken one by one
+# with itemgetter, so a batch does not cost O(m)
+def gather_counters(counters, positions):
+    positions = np.asarray(positions, dtype=np.int64)
+    if not isinstance(counters, list):
+        return np.asarray(counters[positions], dtype=np.int64)
+    if positions.size >= len(counters):
+        return np.asarray(counters, dtype=np.int64)[positions]
+    flat = positions.reshape(-1).tolist()
+    if len(flat) == 1:
+        return np.array([counters[flat[0]]], dtype=np.int64).reshape(positions.shape)
+    return np.array(itemgetter(*flat)(counters) if flat else (), dtype=np.int64).reshape(positions.shape)
+
+
+# Writes the values at the positions (different ones) of the counters. A
+# list of ints is written with map, without a loop in Python
+def scatter_counters(counters, positions, values):
+    if isinstance(counters, list):
+        list(map(counters.__setitem__, np.asarray(positions).tolist(), np.asarray(values).tolist()))
+    else:
+        counters[positions] = values
+    return
@@ -3,29 +3,185 @@ import math
 import random
 import string
 
+import numpy as np
+
 # from LogScreen import LogScreen
+from CounterStorage import RAISE, SATURATE, OVERFLOW_POLICIES, new_counters, max_count, clear_counters, storage_bytes
+from CounterStorage import gather_counters, scatter_counters
 from GenericHashFunctionsMD5 import GenericHashFunctionsMD5
+from GenericHashFunctionsSplitMix64 import MASK64, mix64_array
+from HashBackends import make_hash
+
+
+# Random 64 bit keys of the m positions for the fingerprints of the filters
+# (odd, so every change of a single counter changes the fingerprint)
+def fingerprint_keys(m):
+    return mix64_array(np.arange(1, m + 1, dtype=np.uint64)) | np.uint64(1)
 
 
 # Adaptive bloom filter
 class CountingBloomFilter:
 
-    def __init__(self, m=65536, nhash=5, hash_f=None):
+    def __init__(self, m=65536, nhash=5, hash_f=None, dtype=None, overflow=RAISE):
         # number of counters
         self.m = m
-        # the structure is stored as a flattened array
-        self.bloom_structure = [0] * m
-        # the hash class used to generate the functions
+        # the structure is stored as a flattened array, a list of ints or a
+        # numpy array of the given dtype (see CounterStorage)
+        self.dtype = dtype
+        self.bloom_structure = new_counters(m, dtype)
+        # maximum value of the counters and what to do when one is full
+        assert overflow in OVERFLOW_POLICIES
+        self.max_count = max_count(dtype)
+        self.overflow = overflow
+        # number of increases lost in saturated counters
+        self.saturated = 0
+        # functions called when counters drop to 0 or rise from 0 (see add_zero_listener)
+        self.zero_listeners = []
+        # fingerprint of the counters and keys of the positions (a list of
+        # ints), only kept when it is enabled with track_fingerprint
+        self.fingerprint = None
+        self.keys = None
+        # journals of the open transactions (see begin), one for each level
+        self.journal = []
+        # the hash class used to generate the functions, which can also
+        # be given by the name of one of the registered hash backends
         if hash_f is None:
-            self.hash = GenericHashFunctionsMD5(m, nhash)
+            self.hash = GenericHashFunctionsMD5(m, self.hash_count(nhash))
+        elif isinstance(hash_f, str):
+            self.hash = make_hash(hash_f, m, self.hash_count(nhash))
         else:
             self.hash = hash_f
         # the number of hashes per group, apart from the word hash function
         self.nhash = nhash
 
-    # clear the list of counters
+    # clear the list of counters (in place)
     def clear(self):
-        self.bloom_structure = [0] * len(self.bloom_structure)
+        self.record(range(self.m))
+        watched = self.watch_zero(range(self.m))
+        clear_counters(self.bloom_structure)
+        self.saturated = 0
+        if self.fingerprint is not None:
+            self.fingerprint = 0
+        self.notify_zero(watched)
+
+    # Start a transaction: the changes of the filter from now on can be undone
+    # with rollback or kept with commit. Transactions can be nested, each
+    # rollback or commit closes the last one opened. While a transaction is
+    # open, every operation keeps the previous values of the counters it
+    # changes in a journal, so undoing it only costs the changed positions
+    def begin(self):
+        self.journal.append([self.saturated, [], self.fingerprint])
+        return
+
+    # Undo the changes of the filter since the last begin
+    def rollback(self):
+        saturated, changes, fingerprint = self.journal.pop()
+        counters = self.bloom_structure
+        watched = self.watch_zero([idx for change in changes for idx, value in change])
+        # the oldest value of each position is restored last
+        for change in reversed(changes):
+            for idx, value in reversed(change):
+                counters[idx] = value
+        self.saturated = saturated
+        if self.fingerprint is not None:
+            # the counters are the ones of begin again
+            if fingerprint is None:
+                self.track_fingerprint()
+            else:
+                self.fingerprint = fingerprint
+        self.notify_zero(watched)
+        return
+
+    # Keep the changes of the filter since the last begin. When the
+    # transaction is nested, they can still be undone by the outer one
+    def commit(self):
+        saturated, changes, fingerprint = self.journal.pop()
+        if self.journal:
+            self.journal[-1][1].extend(changes)
+        return
+
+    # Keep the values of the counters at the given positions in the journal
+    # of the last transaction, before an operation changes them
+    def record(self, positions):
+        if not self.journal:
+            return
+        if isinstance(positions, np.ndarray):
+            positions = positions.tolist()
+        counters = self.bloom_structure
+        self.journal[-1][1].append([(idx, counters[idx]) for idx in positions])
+        return
+
+    # Start keeping the fingerprint of the counters, a 64 bit hash of their
+    # values: the sum of the key of each position times its counter (modulo
+    # 2^64), so every operation updates it with an addition for each counter
+    # it changes, and two states of the filter with the same counters (e.g.
+    # after a rollback) have the same fingerprint. Changes of the counters
+    # made directly on get_counters are not seen: call it again to recompute it
+    def track_fingerprint(self):
+        self.keys = fingerprint_keys(self.m).tolist()
+        self.fingerprint = 0
+        self.update_fingerprint_counts(np.asarray(self.bloom_structure, dtype=np.int64))
+        return self.fingerprint
+
+    # Add to the fingerprint the change (an int) of the counters at the
+    # given positions
+    def update_fingerprint(self, positions, change):
+        if self.fingerprint is None:
+            return
+        keys = self.keys
+        fingerprint = self.fingerprint
+        for idx in positions:
+            fingerprint += change * keys[idx]
+        self.fingerprint = fingerprint & MASK64
+        return
+
+    # Add to the fingerprint the changes of all the counters, an array of m
+    # ints (the products and the sum wrap around 64 bits)
+    def update_fingerprint_counts(self, changes):
+        if self.fingerprint is None:
+            return
+        keys = np.asarray(self.keys, dtype=np.uint64)
+        total = int((keys * changes.astype(np.uint64)).sum())
+        self.fingerprint = (self.fingerprint + total) & MASK64
+        return
+
+    # Register a function that is called after every operation (add, remove,
+    # their batch versions, merge, subtract and clear) in which some counters
+    # drop to 0 or rise from 0, as listener(became_zero, left_zero), with
+    # the lists of those positions. So the elements that turn negative or
+    # positive can be found without checking all of them again.
+    # Returns the listener, to remove it later
+    def add_zero_listener(self, listener):
+        self.zero_listeners.append(listener)
+        return listener
+
+    # Unregister a function registered with add_zero_listener
+    def remove_zero_listener(self, listener):
+        self.zero_listeners.remove(listener)
+        return
+
+    # Keep whether the counters at the given positions are 0 before an
+    # operation, only when there are zero listeners (None otherwise)
+    def watch_zero(self, positions):
+        if not self.zero_listeners:
+            return None
+        if isinstance(positions, np.ndarray):
+            positions = positions.tolist()
+        counters = self.bloom_structure
+        return [(idx, counters[idx] == 0) for idx in set(positions)]
+
+    # Call the zero listeners with the positions kept by watch_zero that
+    # changed their zero status during the operation
+    def notify_zero(self, watched):
+        if watched is None:
+            return
+        counters = self.bloom_structure
+        became_zero = [idx for idx, was_zero in watched if not was_zero and counters[idx] == 0]
+        left_zero = [idx for idx, was_zero in watched if was_zero and counters[idx] != 0]
+        if became_zero or left_zero:
+            for listener in list(self.zero_listeners):
+                listener(became_zero, left_zero)
+        return
 
     # Change the hash object that generates the function
     def set_hash(self, hash_object):
@@ -37,58 +193,342 @@ class CountingBloomFilter:
     def get_hash(self):
         return self.hash
 
+    # Number of indices that the hash must give for nhash positions
+    @staticmethod
+    def hash_count(nhash):
+        return nhash
+
+    # Retrieve the parameters of the filter, with the ones of its hash
+    # object, so an equivalent empty filter can be created (see FilterIO)
+    def get_config(self):
+        return {'class': type(self).__name__, 'm': self.m, 'nhash': self.nhash, 'dtype': self.dtype,
+                'overflow': self.overflow, 'hash': self.hash.get_config()}
+
+    # Retrieve the positions of the counters assigned to the element,
+    # one for each of the hashes
+    def get_positions(self, data):
+        return self.hash.get_indices(data)
+
+    # Retrieve the positions of the counters for a (N, nhash) matrix with
+    # the bit indices of N elements (see hash_many)
+    def positions_from_indices(self, indices):
+        return indices
+
+    # Retrieve the positions of the counters of a sequence of elements as a
+    # (N, nhash) matrix, hashed in a single batch
+    def positions_many(self, data):
+        return np.asarray(self.positions_from_indices(self.hash.hash_many(data)), dtype=np.int64)
+
     # method to add an element into the filter
     def add(self, data):
-        # extract a position from each hash to set the bit in the selected word
-        for i in range(self.nhash):
-            # position for the ith hash of the group_i function
-            # the final position in the array is a combination
-            # of word index and bit index
-            idx = self.hash.getbit_idx(data, i)
-            # idx = int(bitidx)
-
-            # set the appropriate bit
-            self.bloom_structure[idx] += 1
+        # increase the counters at the positions given by the hashes
+        self.increment(self.get_positions(data))
 
         return
 
     # method to delete an element from the filter
     def remove(self, data):
-        # extract a position from each hash to set the bit in the selected word
-        for i in range(self.nhash):
-            # position for the ith hash of the group_i function
-            # the final position in the array is a combination
-            # of word index and bit index
-            idx = self.hash.getbit_idx(data, i)
-            # idx = int(bitidx)
+        # decrease the counters at the positions given by the hashes
+        self.decrement(self.get_positions(data))
 
-            # set the appropriate bit
-            self.bloom_structure[idx] -= 1
+        return
 
+    # Increase the counters at the given positions. When a counter of an
+    # array is full, it raises an OverflowError (undoing the increases
+    # already done) or keeps it saturated, depending on the overflow policy
+    def increment(self, positions):
+        self.record(positions)
+        watched = self.watch_zero(positions)
+        counters = self.bloom_structure
+        if self.max_count is None:
+            for idx in positions:
+                counters[idx] += 1
+            done = positions
+        else:
+            done = []
+            for idx in positions:
+                if counters[idx] >= self.max_count:
+                    if self.overflow == SATURATE:
+                        self.saturated += 1
+                        continue
+                    for prev in done:
+                        counters[prev] -= 1
+                    raise OverflowError("Counter " + str(idx) + " is already at its maximum value " + str(self.max_count))
+                counters[idx] += 1
+                done.append(idx)
+        self.update_fingerprint(done, 1)
+        self.notify_zero(watched)
+        return
+
+    # Decrease the counters at the given positions. Decreasing a counter of
+    # an array that is 0 raises an OverflowError (undoing the decreases
+    # already done), and saturated counters are not decreased
+    def decrement(self, positions):
+        self.record(positions)
+        watched = self.watch_zero(positions)
+        counters = self.bloom_structure
+        if self.max_count is None:
+            for idx in positions:
+                counters[idx] -= 1
+            done = positions
+        else:
+            done = []
+            for idx in positions:
+                if counters[idx] == 0:
+                    for prev in done:
+                        counters[prev] += 1
+                    raise OverflowError("Counter " + str(idx) + " is 0 and cannot be decreased")
+                if self.overflow == SATURATE and counters[idx] >= self.max_count:
+                    continue
+                counters[idx] -= 1
+                done.append(idx)
+        self.update_fingerprint(done, -1)
+        self.notify_zero(watched)
         return
 
     # check the bloom filter for the specified data
     def check(self, data, threshold=1):
-        # extract a position from each hash to get the bit from the selected word
-        for i in range(self.nhash):
-            # position for the ith hash of the group_i function
-            # the final position in the array is a combination
-            # of word index and bit index
-            idx = self.hash.getbit_idx(data, i)
-
-            # check if the bit is at least the threshold for the specified word
+        # get the counter from the position given by each hash
+        for idx in self.get_positions(data):
+            # check if the counter is at least the threshold
             # if not, the data is a negative
             if self.bloom_structure[idx] < threshold:
                 return False
         return True
 
+    # method to add a sequence of elements into the filter, hashed in a single batch
+    def add_many(self, data):
+        self.add_indices(self.hash.hash_many(data))
+        return
+
+    # method to delete a sequence of elements from the filter
+    def remove_many(self, data):
+        self.remove_indices(self.hash.hash_many(data))
+        return
+
+    # check a sequence of elements at once. Returns an array of booleans
+    def check_many(self, data, threshold=1):
+        return self.check_indices(self.hash.hash_many(data), threshold)
+
+    # Add the N elements of a (N, nhash) matrix of bit indices (see hash_many).
+    # The counters end as with N calls to add, but a full counter under the
+    # raise policy leaves the filter unchanged for the whole batch
+    def add_indices(self, indices):
+        self.add_counts(self.position_counts(indices))
+        return
+
+    # Remove the N elements of a (N, nhash) matrix of bit indices. An
+    # underflow leaves the filter unchanged for the whole batch
+    def remove_indices(self, indices):
+        self.subtract_counts(self.position_counts(indices))
+        return
+
+    # Increase every counter by the value at the same position of counts
+    # (an array of m ints), following the overflow policy
+    def add_counts(self, counts):
+        self.record(np.flatnonzero(counts))
+        watched = self.watch_zero(np.flatnonzero(counts))
+        counters = self.bloom_structure
+        if self.max_count is None:
+            positions = np.flatnonzero(counts)
+            scatter_counters(counters, positions, gather_counters(counters, positions) + counts[positions])
+            self.update_fingerprint_counts(np.asarray(counts, dtype=np.int64))
+            self.notify_zero(watched)
+            return
+        values = np.asarray(counters).astype(np.int64) + counts
+        full = values > self.max_count
+        if full.any():
+            if self.overflow != SATURATE:
+                idx = int(np.flatnonzero(full)[0])
+                raise OverflowError("Counter " + str(idx) + " is already at its maximum value " + str(self.max_count))
+            self.saturated += int((values[full] - self.max_count).sum())
+            values[full] = self.max_count
+        self.update_fingerprint_counts(values - np.asarray(counters).astype(np.int64))
+        counters[:] = values
+        self.notify_zero(watched)
+        return
+
+    # Decrease every counter by the value at the same position of counts (an
+    # array of m ints). Saturated counters are not decreased
+    def subtract_counts(self, counts):
+        self.record(np.flatnonzero(counts))
+        watched = self.watch_zero(np.flatnonzero(counts))
+        counters = self.bloom_structure
+        if self.max_count is None:
+            positions = np.flatnonzero(counts)
+            scatter_counters(counters, positions, gather_counters(counters, positions) - counts[positions])
+            self.update_fingerprint_counts(-np.asarray(counts, dtype=np.int64))
+            self.notify_zero(watched)
+            return
+        current = np.asarray(counters).astype(np.int64)
+        if self.overflow == SATURATE:
+            # saturated counters are not decreased
+            counts = np.where(current >= self.max_count, 0, counts)
+        values = current - counts
+        if (values < 0).any():
+            idx = int(np.flatnonzero(values < 0)[0])
+            raise OverflowError("Counter " + str(idx) + " is 0 and cannot be decreased")
+        self.update_fingerprint_counts(values - current)
+        counters[:] = values
+        self.notify_zero(watched)
+        return
+
+    # Map every position to the candidates (a sequence of elements) that use
+    # it, to be given to removal_impact
+    def candidate_index(self, candidates):
+        candidates = list(candidates)
+        index = dict()
+        positions = self.positions_many(candidates).tolist()
+        for i in range(len(candidates)):
+            for idx in positions[i]:
+                index.setdefault(idx, []).append(candidates[i])
+        return index
+
+    # Retrieve the candidates (a set of elements accepted by the filter) that
+    # would be rejected if the element, or the elements of a list or tuple
+    # such as a pair, were removed, without changing the filter. They are
+    # the candidates using a counter that would drop to 0, i.e. a counter
+    # equal to the number of times the removed elements use it. index maps
+    # the positions to the candidates (see candidate_index), and it is
+    # created from the candidates when it is not given. With candidates None,
+    # all the candidates of index are taken, so then index must be given
+    # (a ValueError is raised otherwise)
+    def removal_impact(self, elements, candidates, index=None):
+        if candidates is None and index is None:
+            raise ValueError("removal_impact needs the candidates or their index (see candidate_index)")
+        if not isinstance(elements, (list, tuple)):
+            elements = [elements]
+        uses = dict()
+        for element in elements:
+            for idx in self.get_positions(element):
+                uses[idx] = uses.get(idx, 0) + 1
+        counters = self.bloom_structure
+        freed = [idx for idx, times in uses.items() if counters[idx] <= times]
+        if self.overflow == SATURATE and self.max_count is not None:
+            # saturated counters are not decreased
+            freed = [idx for idx in freed if counters[idx] < self.max_count]
+        if not freed:
+            return set()
+        if candidates is None:
+            return {candidate for idx in freed for candidate in index.get(idx, ())}
+        if not isinstance(candidates, (set, frozenset)):
+            candidates = set(candidates)
+        if index is None:
+            index = self.candidate_index(candidates)
+        impact = set()
+        for idx in freed:
+            for candidate in index.get(idx, ()):
+                if candidate in candidates:
+                    impact.add(candidate)
+        return impact
+
+    # Check that other gives the same positions to the elements as this
+    # filter (same class, size, hashes and hash parameters), so the counters
+    # of both can be combined. The storage of the counters can be different
+    def check_compatible(self, other):
+        config = self.get_config()
+        other_config = other.get_config()
+        for config_item in (config, other_config):
+            config_item.pop('dtype')
+            config_item.pop('overflow')
+        if config != other_config:
+            raise ValueError("The filters are not compatible: " + str(config) + " and " + str(other_config))
+        return
+
+    # Add the counters of other, a compatible filter, to the counters of this
+    # one, as if the elements of other were added to this filter
+    def merge(self, other):
+        self.check_compatible(other)
+        self.add_counts(np.asarray(other.bloom_structure, dtype=np.int64))
+        self.saturated += other.saturated
+        return
+
+    # Subtract the counters of other, a compatible filter, from the counters
+    # of this one, as if the elements of other were removed from this filter
+    def subtract(self, other):
+        self.check_compatible(other)
+        self.subtract_counts(np.asarray(other.bloom_structure, dtype=np.int64))
+        return
+
+    # bf += other merges the filters
+    def __iadd__(self, other):
+        self.merge(other)
+        return self
+
+    # bf -= other subtracts the filters
+    def __isub__(self, other):
+        self.subtract(other)
+        return self
+
+    # Check the N elements of a (N, nhash) matrix of bit indices. Returns an
+    # array of N booleans, True for the positives
+    def check_indices(self, indices, threshold=1):
+        positions = self.positions_from_indices(indices)
+        return (gather_counters(self.bloom_structure, positions) >= threshold).all(axis=1)
+
+    # Number of times each counter is used by a (N, nhash) matrix of bit
+    # indices, counting repeated positions as many times as they appear
+    def position_counts(self, indices):
+        positions = np.asarray(self.positions_from_indices(indices), dtype=np.int64)
+        return np.bincount(positions.reshape(-1), minlength=self.m)
+
+    # Retrieve the statistics of the counters, computed with numpy over all
+    # of them at once so they can be taken after every trial:
+    #   * histogram: number of counters with each value, from min_counter to
+    #     the maximum
+    #   * min_counter: value of the first entry of histogram, 0 unless there
+    #     are negative counters (left by removing elements that were not in a
+    #     filter with list storage)
+    #   * zero_fraction: fraction of counters that are 0
+    #   * max_counter: largest value of a counter
+    #   * elements: number of elements in the filter, given or taken from the
+    #     sum of the counters (including the increases lost by saturation)
+    #   * theoretical_fpr: false positive rate expected with those elements
+    #   * estimated_fpr: false positive rate given by the counters in use
+    #   * bytes: memory taken by the structure of the filter
+    def stats(self, elements=None):
+        counters = np.asarray(self.bloom_structure).reshape(-1)
+        # the histogram starts at the smallest counter when it is negative,
+        # since bincount only takes non negative values
+        offset = min(int(counters.min()), 0)
+        histogram = np.bincount(counters.astype(np.int64) - offset, minlength=1 - offset)
+        zero_fraction = float(histogram[-offset]) / self.m
+        if elements is None:
+            elements = self.elements_from_total(int(counters.sum(dtype=np.int64)) + self.saturated)
+        return {'histogram': histogram.tolist(), 'min_counter': offset,
+                'zero_fraction': zero_fraction,
+                'max_counter': offset + histogram.shape[0] - 1, 'elements': elements,
+                'theoretical_fpr': self.theoretical_fpr(elements),
+                'estimated_fpr': self.estimated_fpr(zero_fraction),
+                'bytes': self.bytes_used()}
+
+    # Number of elements that add up to the given sum of the counters: each
+    # element increases nhash counters
+    def elements_from_total(self, total):
+        return total / self.nhash
+
+    # False positive rate of a filter like this one with the given number of
+    # elements, (1 - e^(-k*n/m))^k
+    def theoretical_fpr(self, elements):
+        return (1 - math.exp(-self.nhash * elements / self.m)) ** self.nhash
+
+    # False positive rate estimated from the fraction of counters that are 0:
+    # the probability that the nhash counters of a new element are not 0
+    def estimated_fpr(self, zero_fraction):
+        return (1 - zero_fraction) ** self.nhash
+
+    # Number of bytes taken by the counters (see storage_bytes)
+    def bytes_used(self):
+        return storage_bytes(self.bloom_structure)
+
     # Retrieve the value of a counter
     def get_counter(self, position):
         if len(self.bloom_structure) < position:
             return 0
         return self.bloom_structure[position]
 
-    # Retrieve the structure of counters
+    # Retrieve the structure of counters (not a copy, so the numpy arrays
+    # can be used directly for vectorised operations)
     def get_counters(self):
         return self.bloom_structure
 
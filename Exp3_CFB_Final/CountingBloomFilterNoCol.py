@@ -1,114 +1,51 @@
-import hashlib
-import math
-import random
-import string
-
-# from LogScreen import LogScreen
-from GenericHashFunctionsMD5 import GenericHashFunctionsMD5
-
-
-# Adaptive bloom filter
-class CountingBloomFilterNoCol:
-
-    def __init__(self, m=65536, nhash=5, hash_f=None):
-        # number of counters
-        self.m = m
-        # the structure is stored as a flattened array
-        self.bloom_structure = [0] * m
-        # the hash class used to generate the functions
-        if hash_f is None:
-            self.hash = GenericHashFunctionsMD5(m, nhash)
+import numpy as np
+
+from CounterStorage import RAISE
+from CountingBloomFilter import CountingBloomFilter
+
+
+# Counting bloom filter without collisions: the k positions of an element
+# are always different. When a hash gives a position already used by a
+# previous hash of the same element, the next free position is taken
+class CountingBloomFilterNoCol(CountingBloomFilter):
+
+    def __init__(self, m=65536, nhash=5, hash_f=None, dtype=None, overflow=RAISE):
+        CountingBloomFilter.__init__(self, m, nhash, hash_f, dtype, overflow)
+        # indices and positions of the last element
+        self.lastindices = None
+        self.lastpositions = None
+
+    # Retrieve the positions of the counters assigned to the element
+    # avoiding hash collisions. The positions of the last element are kept,
+    # and reused while the hash gives back the same indices (the hash
+    # objects return the same tuple for the elements they keep)
+    def get_positions(self, data):
+        indices = self.hash.get_indices(data)
+        if indices is self.lastindices:
+            return self.lastpositions
+        if len(set(indices)) == len(indices):
+            hashes = indices
         else:
-            self.hash = hash_f
-        # the number of hashes per group, apart from the word hash function
-        self.nhash = nhash
-
-    # clear the list of counters
-    def clear(self):
-        self.bloom_structure = [0] * len(self.bloom_structure)
-
-    # Change the hash object that generates the function
-    def set_hash(self, hash_object):
-        if hash_object is not None:
-            self.hash = hash_object
-        return
-
-    # Get the hash object that generates the function
-    def get_hash(self):
-        return self.hash
-
-    # method to add an element into the filter
-    def add(self, data):
-        # extract a position from each hash to set the bit in the selected word
-        hashes = []
-        for i in range(self.nhash):
-            # position for the ith hash of the group_i function
-            # the final position in the array is a combination
-            # of word index and bit index
-            # we also avoid hash colisions
-            idx = self.hash.getbit_idx(data, i)
-            while idx in hashes:
-                idx = (idx + 1) % self.m
-            hashes.append(idx)
-            # idx = int(bitidx)
-
-            # set the appropriate bit
-            self.bloom_structure[idx] += 1
-
-        return
-
-    # method to delete an element from the filter
-    def remove(self, data):
-        # extract a position from each hash to set the bit in the selected word
-        hashes = []
-        for i in range(self.nhash):
-            # position for the ith hash of the group_i function
-            # the final position in the array is a combination
-            # of word index and bit index
-            idx = self.hash.getbit_idx(data, i)
-            while idx in hashes:
-                idx = (idx + 1) % self.m
-            hashes.append(idx)
-            # idx = int(bitidx)
-
-            # set the appropriate bit
-            self.bloom_structure[idx] -= 1
-
-        return
-
-    # check the bloom filter for the specified data
-    def check(self, data, threshold=1):
-        # extract a position from each hash to get the bit from the selected word
-        hashes = []
-        for i in range(self.nhash):
-            # position for the ith hash of the group_i function
-            # the final position in the array is a combination
-            # of word index and bit index
-            idx = self.hash.getbit_idx(data, i)
-            while idx in hashes:
-                idx = (idx + 1) % self.m
-            hashes.append(idx)
-
-            # check if the bit is at least the threshold for the specified word
-            # if not, the data is a negative
-            if self.bloom_structure[idx] < threshold:
-                return False
-        return True
-
-    # Retrieve the value of a counter
-    def get_counter(self, position):
-        if len(self.bloom_structure) < position:
-            return 0
-        return self.bloom_structure[position]
-
-    # Retrieve the structure of counters
-    def get_counters(self):
-        return self.bloom_structure
-
-    # Debug function for printing content
-    # def printme(self):
-    #     sc = LogScreen()
-    #     for i in range(self.m):
-    #         info = "Row=%d, count=%d" % (i, self.bloom_structure[i])
-    #         sc.write(info)
-    #     return
+            hashes = []
+            for idx in indices:
+                while idx in hashes:
+                    idx = (idx + 1) % self.m
+                hashes.append(idx)
+        self.lastindices = indices
+        self.lastpositions = hashes
+        return hashes
+
+    # Retrieve the positions of the counters for a (N, nhash) matrix with
+    # the bit indices of N elements, avoiding hash collisions. The nth
+    # position of all the elements is solved at once: the rows where it is
+    # one of the previous positions of the element move to the next
+    # counter, until none of them collides
+    def positions_from_indices(self, indices):
+        positions = np.array(indices, dtype=np.int64).reshape(-1, self.nhash)
+        for n in range(1, positions.shape[1]):
+            rows = np.arange(positions.shape[0])
+            while rows.shape[0] > 0:
+                column = positions[rows, n]
+                rows = rows[(positions[rows, :n] == column[:, None]).any(axis=1)]
+                positions[rows, n] = (positions[rows, n] + 1) % self.m
+        return positions
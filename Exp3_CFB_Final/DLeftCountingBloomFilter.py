@@ -0,0 +1,256 @@
+import math
+
+import numpy as np
+
+from CounterStorage import RAISE, gather_counters
+from CountingBloomFilter import CountingBloomFilter
+from GenericHashFunctionsSplitMix64 import mix64
+
+
+# Multipliers and offsets of the permutations t -> (a*t + b) % size of the
+# true fingerprints [0, size) of the d tables, with a coprime to size so
+# each one is a permutation
+def table_permutations(d, size):
+    permutations = []
+    for n in range(d):
+        a = mix64(2 * n + 1) % size | 1
+        while math.gcd(a, size) != 1:
+            a += 2
+        permutations.append((a, mix64(2 * n + 2) % size))
+    return permutations
+
+
+# Smallest unsigned dtype that holds remainders of the given number of bits
+def remainder_dtype(bits):
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if bits <= np.iinfo(dtype).bits:
+            return dtype
+    raise ValueError("The remainders cannot have more than 32 bits")
+
+
+# d-left counting bloom filter: the m cells are split in nhash (d) tables of
+# buckets of bucket_size cells, and each cell keeps a remainder of
+# remainder_bits bits and a counter. The hash gives two indices that make
+# the true fingerprint of the element, and a different permutation of it in
+# each table gives the bucket and the remainder of the element in that table.
+# An element is added to the cell with its remainder in one of its d buckets
+# (increasing its counter), or to a free cell of the least loaded one (the
+# leftmost on ties). Since the tables use permutations, two elements with
+# the same bucket and remainder in a table have the same true fingerprint,
+# so there is at most one cell for each element.
+# The positions of an element are the single cell that holds its remainder,
+# so the counters of the cells work with the peeling of the experiments as
+# a filter with k=1. The last m % (d * bucket_size) cells are not used
+class DLeftCountingBloomFilter(CountingBloomFilter):
+
+    def __init__(self, m=65536, nhash=4, hash_f=None, dtype=None, overflow=RAISE, bucket_size=8, remainder_bits=8):
+        CountingBloomFilter.__init__(self, m, nhash, hash_f, dtype, overflow)
+        # number of cells of each bucket and buckets of each table
+        self.bucket_size = bucket_size
+        self.buckets = m // (nhash * bucket_size)
+        assert self.buckets > 0
+        # the true fingerprints are in [0, buckets * 2^remainder_bits)
+        self.remainder_bits = remainder_bits
+        self.fingerprints = self.buckets << remainder_bits
+        # the permutations are calculated in 64 bits
+        assert self.fingerprints < (1 << 32)
+        self.permutations = table_permutations(nhash, self.fingerprints)
+        # remainder of each cell, only valid when its counter is not 0
+        self.remainders = np.zeros(m, dtype=remainder_dtype(remainder_bits))
+        # journals of the remainders changed in the open transactions
+        self.remainder_journal = []
+
+    # Number of indices that the hash must give: two indices of [0, m) for
+    # the true fingerprint, whatever the number of tables
+    @staticmethod
+    def hash_count(nhash):
+        return 2
+
+    # Retrieve the parameters of the filter
+    def get_config(self):
+        config = CountingBloomFilter.get_config(self)
+        config['bucket_size'] = self.bucket_size
+        config['remainder_bits'] = self.remainder_bits
+        return config
+
+    # Arrays of the filter saved with the counters (see FilterIO)
+    def extra_arrays(self):
+        return {'remainders': self.remainders}
+
+    # The remainders changed in a transaction are restored with rollback, so
+    # a cell freed and used again by another element gets back its remainder
+    def begin(self):
+        CountingBloomFilter.begin(self)
+        self.remainder_journal.append([])
+        return
+
+    # Undo the changes of the filter since the last begin
+    def rollback(self):
+        for cell, remainder in reversed(self.remainder_journal.pop()):
+            self.remainders[cell] = remainder
+        CountingBloomFilter.rollback(self)
+        return
+
+    # Keep the changes of the filter since the last begin
+    def commit(self):
+        changes = self.remainder_journal.pop()
+        if self.remainder_journal:
+            self.remainder_journal[-1].extend(changes)
+        CountingBloomFilter.commit(self)
+        return
+
+    # Retrieve the first cell of the bucket and the remainder of the element
+    # with the given hash indices in each table
+    def locate(self, indices):
+        size = self.fingerprints
+        fingerprint = (indices[0] * self.m + indices[1]) % size
+        slots = []
+        for n, (a, b) in enumerate(self.permutations):
+            value = (a * fingerprint + b) % size
+            bucket = n * self.buckets + (value >> self.remainder_bits)
+            slots.append((bucket * self.bucket_size, value & ((1 << self.remainder_bits) - 1)))
+        return slots
+
+    # Same as locate for a (N, 2) matrix with the indices of N elements.
+    # Returns two (N, d) matrices with the first cells and the remainders
+    def locate_many(self, indices):
+        indices = np.asarray(indices, dtype=np.int64).reshape(-1, 2).astype(np.uint64)
+        size = np.uint64(self.fingerprints)
+        fingerprint = (indices[:, 0] * np.uint64(self.m) + indices[:, 1]) % size
+        starts = np.empty((indices.shape[0], self.nhash), dtype=np.int64)
+        remainders = np.empty((indices.shape[0], self.nhash), dtype=np.uint32)
+        for n, (a, b) in enumerate(self.permutations):
+            value = (np.uint64(a) * fingerprint + np.uint64(b)) % size
+            buckets = n * self.buckets + (value >> np.uint64(self.remainder_bits)).astype(np.int64)
+            starts[:, n] = buckets * self.bucket_size
+            remainders[:, n] = value & np.uint64((1 << self.remainder_bits) - 1)
+        return starts, remainders
+
+    # Retrieve the cell that holds the remainder of the element in one of
+    # the buckets given by slots (see locate), or None if there is not any
+    def find_cell(self, slots):
+        counters = self.bloom_structure
+        remainders = self.remainders
+        for start, remainder in slots:
+            for cell in range(start, start + self.bucket_size):
+                if counters[cell] != 0 and remainders[cell] == remainder:
+                    return cell
+        return None
+
+    # Retrieve a free cell of the least loaded bucket given by slots and the
+    # remainder of the element in it. Raises an OverflowError when all the
+    # buckets are full
+    def free_cell(self, slots):
+        counters = self.bloom_structure
+        best = None
+        best_load = self.bucket_size
+        for start, remainder in slots:
+            free = [cell for cell in range(start, start + self.bucket_size) if counters[cell] == 0]
+            if free and self.bucket_size - len(free) < best_load:
+                best = (free[0], remainder)
+                best_load = self.bucket_size - len(free)
+        if best is None:
+            raise OverflowError("All the buckets of the element are full")
+        return best
+
+    # Retrieve the positions of the counters assigned to the element: the
+    # cell that holds its remainder, or none if it is not in the filter
+    def get_positions(self, data):
+        cell = self.find_cell(self.locate(self.hash.get_indices(data)))
+        return () if cell is None else (cell,)
+
+    # Retrieve the positions of the counters for a (N, 2) matrix with the
+    # indices of N elements, as a (N, 1) matrix with the cell of each one
+    # (-1 for the elements that are not in the filter, which is not a cell:
+    # use check_indices to check elements that may not be in the filter)
+    def positions_from_indices(self, indices):
+        cells, match = self.match_many(indices)
+        found = cells[np.arange(cells.shape[0]), match.argmax(axis=1)]
+        return np.where(match.any(axis=1), found, -1)[:, None]
+
+    # Retrieve the (N, d * bucket_size) matrices of the cells of the buckets
+    # of N elements, given by their (N, 2) indices, and of whether each cell
+    # holds the remainder of the element
+    def match_many(self, indices):
+        starts, remainders = self.locate_many(indices)
+        cells = (starts[:, :, None] + np.arange(self.bucket_size)).reshape(starts.shape[0], -1)
+        remainders = np.repeat(remainders, self.bucket_size, axis=1)
+        return cells, (gather_counters(self.bloom_structure, cells) != 0) & (self.remainders[cells] == remainders)
+
+    # Add the element with the given hash indices
+    def insert(self, indices):
+        slots = self.locate(indices)
+        cell = self.find_cell(slots)
+        if cell is None:
+            cell, remainder = self.free_cell(slots)
+            if self.remainder_journal:
+                self.remainder_journal[-1].append((cell, int(self.remainders[cell])))
+            self.remainders[cell] = remainder
+        self.increment((cell,))
+        return
+
+    # Remove the element with the given hash indices. Removing an element
+    # that is not in the filter raises an OverflowError
+    def delete(self, indices):
+        cell = self.find_cell(self.locate(indices))
+        if cell is None:
+            raise OverflowError("The element is not in the filter and cannot be removed")
+        self.decrement((cell,))
+        return
+
+    # method to add an element into the filter
+    def add(self, data):
+        self.insert(self.hash.get_indices(data))
+        return
+
+    # method to delete an element from the filter
+    def remove(self, data):
+        self.delete(self.hash.get_indices(data))
+        return
+
+    # check the bloom filter for the specified data
+    def check(self, data, threshold=1):
+        cell = self.find_cell(self.locate(self.hash.get_indices(data)))
+        return cell is not None and self.bloom_structure[cell] >= threshold
+
+    # Add the N elements of a (N, 2) matrix of indices one by one, since the
+    # cell of each element depends on the ones added before
+    def add_indices(self, indices):
+        for row in np.asarray(indices).tolist():
+            self.insert(row)
+        return
+
+    # Remove the N elements of a (N, 2) matrix of indices one by one
+    def remove_indices(self, indices):
+        for row in np.asarray(indices).tolist():
+            self.delete(row)
+        return
+
+    # Check the N elements of a (N, 2) matrix of indices. Returns an array
+    # of N booleans, True for the positives
+    def check_indices(self, indices, threshold=1):
+        cells, match = self.match_many(indices)
+        return (match & (gather_counters(self.bloom_structure, cells) >= threshold)).any(axis=1)
+
+    # Each element increases a single counter
+    def elements_from_total(self, total):
+        return total
+
+    # A new element is a false positive when its true fingerprint is the one
+    # of a cell in use, so with n elements the rate is the probability that
+    # one of them has the same true fingerprint
+    def theoretical_fpr(self, elements):
+        return 1 - (1 - 1 / self.fingerprints) ** elements
+
+    # The cells in use have different true fingerprints
+    def estimated_fpr(self, zero_fraction):
+        return min(1.0, (1 - zero_fraction) * self.m / self.fingerprints)
+
+    # Number of bytes taken by the counters and the remainders
+    def bytes_used(self):
+        return CountingBloomFilter.bytes_used(self) + self.remainders.nbytes
+
+    # The cells of two d-left filters hold different remainders, so their
+    # counters cannot be combined (merge and subtract)
+    def check_compatible(self, other):
+        raise ValueError("The counters of the d-left filters cannot be combined")
@@ -0,0 +1,118 @@
+import json
+
+import numpy as np
+
+from GenericHashFunctions import BATCH_SIZE
+from HashBackends import make_hash
+
+# Digests of a fixed set of elements, calculated once and shared by the
+# hash objects of any (m, k) configuration of the same hash backend, since
+# every configuration only takes different bits of the same digest.
+# Only the backends with a real digest (md5, sha512, blake2b) can be stored.
+#
+# Example of a sweep that hashes each element exactly once:
+#   store = DigestStore('sha512', elements)
+#   for m, k in configurations:
+#       bf = CountingBloomFilterNoCol(m, k, store.hash_for(m, k))
+#       ...
+#
+# With a path, the digests are kept in a memory-mapped .npy file (and the
+# elements and hash parameters next to it), and DigestStore.open(path)
+# loads them again in later runs.
+class DigestStore:
+
+    def __init__(self, hash_name, elements, path=None, **params):
+        # name and parameters (key_encoding, digest_size) of the backend
+        self.hash_name = hash_name
+        self.params = params
+        # any configuration gives the same digests
+        hashf = make_hash(hash_name, 2, 1, **params)
+        assert hashf.hash is not None, "The " + hash_name + " backend has no digest to be stored"
+        self.elements = np.asarray(elements)
+        # row of each element, created with the first lookup
+        self.rows = None
+        num = self.elements.shape[0]
+        digest_bytes = hashf.digest_bits // 8
+        if path is None:
+            self.digests = np.empty((num, digest_bytes), dtype=np.uint8)
+        else:
+            self.digests = np.lib.format.open_memmap(path, mode='w+', dtype=np.uint8, shape=(num, digest_bytes))
+        for start in range(0, num, BATCH_SIZE):
+            chunk = self.elements[start:start + BATCH_SIZE]
+            self.digests[start:start + len(chunk)] = hashf.digest_many(hashf.encode_many(chunk))
+        if path is not None:
+            self.digests.flush()
+            np.save(path + '.elements.npy', self.elements)
+            with open(path + '.json', 'w') as f:
+                json.dump({'hash': hash_name, 'params': params}, f)
+        return
+
+    # Loads a store saved in path, with the digests memory-mapped
+    @classmethod
+    def open(cls, path):
+        with open(path + '.json') as f:
+            config = json.load(f)
+        store = cls.__new__(cls)
+        store.hash_name = config['hash']
+        store.params = config['params']
+        store.elements = np.load(path + '.elements.npy')
+        store.rows = None
+        store.digests = np.load(path, mmap_mode='r')
+        return store
+
+    # Retrieves the row of the element in the store, or None if it is not stored
+    def get_row(self, element):
+        if self.rows is None:
+            self.rows = {element: row for row, element in enumerate(self.elements.tolist())}
+        return self.rows.get(element)
+
+    # Retrieves the (N, k) bit indices of all the stored elements for a
+    # filter with m counters and k hashes
+    def indices(self, m, k, double_hashing=False):
+        hashf = make_hash(self.hash_name, m, k, double_hashing=double_hashing, **self.params)
+        indices = np.empty((self.digests.shape[0], k), dtype=np.int64)
+        for start in range(0, self.digests.shape[0], BATCH_SIZE):
+            indices[start:start + BATCH_SIZE] = hashf.digests_indices(self.digests[start:start + BATCH_SIZE])
+        return indices
+
+    # Creates a hash object for a filter with m counters and k hashes that
+    # takes the digests of the stored elements from the store
+    def hash_for(self, m, k, double_hashing=False):
+        return StoredDigestHashFunctions(self, make_hash(self.hash_name, m, k, double_hashing=double_hashing,
+                                                         **self.params))
+
+
+# Hash object (same contract as GenericHashFunctions) that splits the digests
+# of a DigestStore. Elements that are not in the store are hashed as usual
+class StoredDigestHashFunctions:
+
+    def __init__(self, store, hashf):
+        self.store = store
+        # the hash object of the configuration, used to split the digests
+        self.hashf = hashf
+        self.m = hashf.m
+        self.nhash = hashf.nhash
+        return
+
+    # Retrieves the bit indices of all the hashes for the element
+    def get_indices(self, element):
+        row = self.store.get_row(element)
+        if row is None:
+            return self.hashf.get_indices(element)
+        return self.hashf.digest_indices(int.from_bytes(self.store.digests[row].tobytes(), 'big'))
+
+    # Retrieves the bit index using the nth hash for the element
+    def getbit_idx(self, element, n):
+        return self.get_indices(element)[n]
+
+    # Retrieves the bit indices of all the hashes for a sequence of elements
+    def hash_many(self, elements, key_width=None):
+        if key_width is None:
+            rows = [self.store.get_row(element) for element in elements]
+            if None not in rows:
+                return self.hashf.digests_indices(self.store.digests[rows])
+        return self.hashf.hash_many(elements, key_width)
+
+    # Retrieves the parameters of the configuration
+    def get_config(self):
+        return self.hashf.get_config()
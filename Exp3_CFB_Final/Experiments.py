@@ -1,9 +1,17 @@
 import random
+import numpy as np
 import sys
 import getopt
 from CountingBloomFilter import CountingBloomFilter
 from CountingBloomFilterNoCol import CountingBloomFilterNoCol
+from BlockedCountingBloomFilter import BlockedCountingBloomFilter
+from PartitionedCountingBloomFilter import PartitionedCountingBloomFilter
+from DLeftCountingBloomFilter import DLeftCountingBloomFilter
 from GenericHashFunctionsSHA512 import GenericHashFunctionsSHA512
+from HashBackends import HASH_BACKENDS, make_hash
+from UniverseIndexTable import find_p_table
+from GenericHashFunctions import BATCH_SIZE, KEY_ENCODINGS
+from CounterStorage import COUNTER_DTYPES, OVERFLOW_POLICIES
 from math import e
 from math import log as ln
 import matplotlib
@@ -68,17 +76,42 @@ def find_threshold():
 # trials = 100
 max_val = 1000000000
 
+# Counting filter variants that can be selected with -F. All of them give
+# k different positions to each element, but the d-left one, which stores
+# each element in a single cell of one of its k (d) tables
+FILTERS = {
+    'nocol': CountingBloomFilterNoCol,
+    'blocked': BlockedCountingBloomFilter,
+    'partitioned': PartitionedCountingBloomFilter,
+    'dleft': DLeftCountingBloomFilter,
+}
+
 parser = argparse.ArgumentParser()
 parser.add_argument("-m", dest="m", type=int, help="Filter size (default 1024)", default=1024)
 parser.add_argument("-n", dest="n", type=int, help="Number of true positives (default 256)", default=256)
 parser.add_argument("-t", dest="t", type=int, help="Number of iterations (default 100)", default=100)
 parser.add_argument("-k", dest="k", type=int, help="Number of hashes (default 3)", default=3)
+parser.add_argument("-H", dest="hash", choices=sorted(HASH_BACKENDS), help="Hash backend (default md5)", default="md5")
+parser.add_argument("-d", dest="digest_size", type=int, help="Digest size in bytes of the blake2b backend (default 16)", default=16)
+parser.add_argument("-D", dest="double_hashing", action="store_true", help="Derive the hashes with double hashing (h1 + i*h2) instead of splitting the digest")
+parser.add_argument("-e", dest="key_encoding", choices=KEY_ENCODINGS, help="Encoding of the elements before hashing them (default str)", default="str")
+parser.add_argument("-s", dest="seed", type=int, help="Seed of the oracle hash backend, combined with the trial (default 0)", default=0)
+parser.add_argument("-C", dest="dtype", choices=COUNTER_DTYPES, help="Store the counters in a numpy array of this dtype, or packed in 4 bits with uint4 (default a list of ints)", default=None)
+parser.add_argument("-O", dest="overflow", choices=OVERFLOW_POLICIES, help="What to do when a counter of the array is full (default raise)", default="raise")
+parser.add_argument("-F", dest="filter", choices=sorted(FILTERS), help="Collision-free counting filter variant, with k tables for dleft (default nocol)", default="nocol")
 # parser.add_argument("-p", dest="pairs", type=int, help="Carry pair extraction or not (default 0 - False). Any other number means True", default=0)
 args = parser.parse_args()
 filter_size = args.m
 n = args.n
 trials = args.t
 k = args.k
+hash_name = args.hash
+hash_params = {'digest_size': args.digest_size} if hash_name == 'blake2b' else {}
+hash_params['double_hashing'] = args.double_hashing
+hash_params['key_encoding'] = args.key_encoding
+counter_dtype = args.dtype
+counter_overflow = args.overflow
+filter_class = FILTERS[args.filter]
 
 # Function to generate the random set of elements.
 # Current version uses strings
@@ -96,6 +129,7 @@ def generate_random_elements(num, bf=None, ds=None, max_val=1000000000, exclude=
 
     # Keeps data of stored elements
     stored = 0
+    entries = []
     # Generate elements until the value "stored" is reached
     while stored < num:
         # Generate integers between 1 and max_val
@@ -104,10 +138,8 @@ def generate_random_elements(num, bf=None, ds=None, max_val=1000000000, exclude=
         # go to next iteration
         if entry in s or entry in exclude:
             continue
-        # When an BloomFilter is received
-        if bf is not None:
-            # Add the entry to the filter
-            bf.add(entry)
+        # Keep the entry to add it to the filter
+        entries.append(entry)
         # When a list is received
         if ds is not None:
             # Add the element to the list
@@ -116,6 +148,9 @@ def generate_random_elements(num, bf=None, ds=None, max_val=1000000000, exclude=
         stored = stored + 1
         # Add it to the set so they are not repeated
         s.add(entry)
+    # When a filter is received, all the entries are added to it in a single batch
+    if bf is not None:
+        bf.add_many(entries)
     return
 
 # Function to generate a random set of false positives
@@ -150,18 +185,41 @@ def generate_random_fp(num, bf, max_val=1000000000, exclude=None):
         s.add(entry)
     return false_positives
 
+# Function to generate a set of false positives when the filter uses the oracle hash.
+# The positions of every id are independent and uniform, so instead of random ids
+# the consecutive ids starting at first are tested, checked by batches of
+# BATCH_SIZE ids with check_many
+# num is the number of false positives to generate
+# bf is the CountingBloomFilter in which to test the elements to find false positives
+# first is the first id to be tested (the true positives must use smaller ids)
+# returns a list with the generated false positives (the first num positives)
+def generate_sequential_fp(num, bf, first):
+    false_positives = []
+    start = first
+    while len(false_positives) < num:
+        batch = range(start, start + BATCH_SIZE)
+        positive = bf.check_many(batch, 1)
+        false_positives.extend(batch[i] for i in np.flatnonzero(positive)[:num - len(false_positives)].tolist())
+        start = start + BATCH_SIZE
+    return false_positives
+
 # Function to find all elements from the universe that returns a positive from CBF
 # bf is the Counting Bloom Filter
 # max_val is the maximum integer value. Universe will include elements from 1 to max_val
-def find_p(bf, max_val):
+# table is an optional index table of the universe precomputed with the hash of bf
+# (see UniverseIndexTable), so the elements are not hashed again
+def find_p(bf, max_val, table=None):
+    if table is not None:
+        return find_p_table(bf, table, max_val)
     # Create the list P of (true and false) positive elements
     p = list()
-    # Check all elements of the universe, from 1 to max_val
-    for i in range(max_val+1):
+    # Check all elements of the universe, from 1 to max_val, by batches
+    for start in range(0, max_val+1, BATCH_SIZE):
+        batch = range(start, min(start + BATCH_SIZE, max_val+1))
         # If one of the positions is 0, then it is a negative
         # Otherwise, add it to P
-        if bf.check(i, 1):
-            p.append(i)
+        positive = bf.check_many(batch, 1)
+        p.extend(batch[i] for i in np.flatnonzero(positive).tolist())
 
     return p
 
@@ -171,12 +229,14 @@ def find_p(bf, max_val):
 def find_p_set(bf, set):
     # Create the list P of (true and false) positive elements
     p = list()
-    # Check all elements of the set
-    for element in set:
+    # Check all elements of the set in a single batch
+    elements = list(set)
+    positive = bf.check_many(elements, 1).tolist()
+    for i in range(len(elements)):
         # If one of the positions is 0, then it is a negative
         # Otherwise, add it to P
-        if bf.check(element, 1):
-            p.append(element)
+        if positive[i]:
+            p.append(elements[i])
 
     return p
 
@@ -186,11 +246,10 @@ def find_p_set(bf, set):
 # positives is the list of elements to be removed
 # count_cbf is the list of counters from the CBF
 # count is the list of counters from T
-# hashf is the hash function used in the CBF
+# positions maps every element of T to the positions of its counters (see peeling)
 # k is the number of positions
 # is_positive indicates if it is a real positive (true) or a false positive (false)
-# nocol is a boolean indicating whether no collision is activated or not
-def clear_positions(m, elements, positives, count_cbf, count, hashf, k, is_positive, nocol):
+def clear_positions(m, elements, positives, count_cbf, count, positions, k, is_positive):
     # Additional elements to be removed
     additional = list()
     # and iterate over them
@@ -200,15 +259,8 @@ def clear_positions(m, elements, positives, count_cbf, count, hashf, k, is_posit
     for i in range(num):
         # get next element to be removed
         next_positive = positives[i]
-        # for the k hash functions
-        hashes = []
-        for j in range(k):
-            # Get the position mapped for the element and the jth hash function
-            jpos = hashf.getbit_idx(next_positive, j)
-            if nocol:
-                while jpos in hashes:
-                    jpos = (jpos + 1) % m
-                hashes.append(jpos)
+        # for the k positions of the element
+        for jpos in positions[next_positive]:
             # Element might have been removed in a different level of recursion
             if elements[jpos].count(next_positive) == 0:
                 break
@@ -228,7 +280,7 @@ def clear_positions(m, elements, positives, count_cbf, count, hashf, k, is_posit
     # Recursive call to remove the false positive elements
     if len(additional) > 0:
         # Pass False as last parameter as they are false positives
-        clear_positions(m, elements, additional, count_cbf, count, hashf, k, False, nocol)
+        clear_positions(m, elements, additional, count_cbf, count, positions, k, False)
 
     return
 
@@ -249,18 +301,17 @@ def peeling(m, k, cbf, p, nocol, top):
     # Count of elements mapped to each position
     count = [0] * m
 
+    # Positions of all the elements in p, hashed in a single batch
+    indices = hashf.hash_many(p)
+    # If no collision is activated, the filter solves the repeated positions of every element
+    if nocol:
+        indices = cbf.positions_from_indices(indices)
+    # Positions of each element, used again when the elements are removed
+    positions = dict(zip(p, indices.tolist()))
     # For all the positions in p
     for i in range(len(p)):
-        hashes = []
-        # for the k hash functions
-        for j in range(k):
-            # Get the position mapped for the element p[i] and the jth hash function
-            pos = hashf.getbit_idx(p[i], j)
-            # If no collision is activated, we recalculate the value of the hash
-            if nocol:
-                while pos in hashes:
-                    pos = (pos + 1) % m
-                hashes.append(pos)
+        # for the positions of the k hash functions
+        for pos in positions[p[i]]:
             # Retrieve the position pos of the T array
             list_pos = elements[pos]
             # If no elements are assigned to that position, create a list and assign it
@@ -274,8 +325,10 @@ def peeling(m, k, cbf, p, nocol, top):
 
     # Set that will store the positives that were extracted from the filter
     positives = set()
-    # Values for the CBF counters
-    counters = cbf.get_counters()
+    # Values for the CBF counters, unpacked in a list of ints whatever their
+    # storage (see CounterStorage), so each counter is read fast by the loop.
+    # It is a copy, the counters of the filter are not changed by the peeling
+    counters = np.asarray(cbf.get_counters()).tolist()
 
     while True:
         # If we found an element that could be extracted in this iteration
@@ -299,7 +352,7 @@ def peeling(m, k, cbf, p, nocol, top):
             removers = elements[i].copy()
             # call the function that clears the removers and related false positives
             # pass True as last parameter as they are real positives
-            clear_positions(m, elements, removers, counters, count, hashf, k, True, nocol)
+            clear_positions(m, elements, removers, counters, count, positions, k, True)
         # if no new positives were found in the iteration, we should finish the algorithm
         if not found:
             break
@@ -307,6 +360,23 @@ def peeling(m, k, cbf, p, nocol, top):
     # return elements that were retrieved from the CBF
     return positives
 
+# Function that averages the statistics of the filters of all the trials (see stats)
+# The histograms are averaged value by value, and the minimum and maximum
+# counters are the smallest and largest ones of all the filters
+# stats_list is the list with the statistics of each trial
+def average_stats(stats_list):
+    average = dict()
+    for key in ('zero_fraction', 'elements', 'theoretical_fpr', 'estimated_fpr', 'bytes'):
+        average[key] = sum(stats[key] for stats in stats_list) / len(stats_list)
+    average['min_counter'] = min(stats['min_counter'] for stats in stats_list)
+    average['max_counter'] = max(stats['max_counter'] for stats in stats_list)
+    histogram = np.zeros(average['max_counter'] - average['min_counter'] + 1)
+    for stats in stats_list:
+        start = stats['min_counter'] - average['min_counter']
+        histogram[start:start + len(stats['histogram'])] += stats['histogram']
+    average['histogram'] = (histogram / len(stats_list)).tolist()
+    return average
+
 x_axis = []
 y1_axis = []
 y2_axis = []
@@ -317,10 +387,16 @@ y6_axis = []
 y7_axis = []
 y8_axis = []
 y9_axis = []
+# average statistics of the filters with the true positives for each point
+stats_axis = []
 
 dots = [(x*n)//10 for x in range(0,51)]
 
-f = open(str(filter_size) + '_' + str(k) + '_' + str(n) + '.results', 'w')
+# Name of the output files, with the filter variant when it is not the default one
+output_name = str(filter_size) + '_' + str(k) + '_' + str(n)
+if args.filter != 'nocol':
+    output_name += '_' + args.filter
+f = open(output_name + '.results', 'w')
 f.write("Start: " + time.ctime(time.time()) + "\n")
 for fals in dots:
     avg_blackbox_ind = 0
@@ -329,21 +405,35 @@ for fals in dots:
     worst_blackbox_pairs = 100
     avg_whitebox = 0
     worst_whitebox = 100
-    for _ in range(trials):
+    trial_stats = []
+    for trial in range(trials):
 
         # Generate a standard CBF with the testing parameters
-        bf = CountingBloomFilterNoCol(filter_size, k)
-
-        # Fill the filter with random elements
-        true_positives = []
-        generate_random_elements(n, bf, true_positives, max_val)
+        if hash_name == 'oracle':
+            # the oracle positions are drawn again for every trial
+            hash_params['seed'] = (args.seed, fals, trial)
+        hashf = make_hash(hash_name, filter_size, filter_class.hash_count(k), **hash_params)
+        bf = filter_class(filter_size, k, hashf, counter_dtype, counter_overflow)
+
+        if hash_name == 'oracle':
+            # With the oracle, the ids 1 to n are already random elements
+            true_positives = list(range(1, n + 1))
+            bf.add_many(true_positives)
+            # and the false positives are searched from the next id
+            false_positives = generate_sequential_fp(fals, bf, n + 1)
+        else:
+            # Fill the filter with random elements
+            true_positives = []
+            generate_random_elements(n, bf, true_positives, max_val)
 
-        # Generate a certain number of false positives
-        false_positives = generate_random_fp(fals, bf, max_val, true_positives)
+            # Generate a certain number of false positives
+            false_positives = generate_random_fp(fals, bf, max_val, true_positives)
 
         # Run the algorithm
         all_positives = true_positives + false_positives
         all_positives_set = set(all_positives)
+        # Statistics of the counters before the peeling changes them
+        trial_stats.append(bf.stats())
 
         # First, we carry out the unconstrained whitebox analysis
         found_tps = peeling(filter_size, k, bf, all_positives, 1, FULL)
@@ -353,9 +443,8 @@ for fals in dots:
             worst_whitebox = prct_obtained
 
         # Then, we carry out the whitebox analysis limited to counters with value 1 (equivalent to blackbox ind)
-        bf = CountingBloomFilterNoCol(filter_size, k)
-        for pos in true_positives:
-            bf.add(pos)
+        bf = filter_class(filter_size, k, hashf, counter_dtype, counter_overflow)
+        bf.add_many(true_positives)
         found_tps = peeling(filter_size, k, bf, all_positives, 1, IND)
         prct_obtained = (len(found_tps)/len(true_positives)) * 100
         avg_blackbox_ind += prct_obtained/trials
@@ -363,9 +452,8 @@ for fals in dots:
             worst_blackbox_ind = prct_obtained
 
         # Finally, we carry out the whitebox analysis limited to counters with value 2 (equivalent to blackbox pairs)
-        bf = CountingBloomFilterNoCol(filter_size, k)
-        for pos in true_positives:
-            bf.add(pos)
+        bf = filter_class(filter_size, k, hashf, counter_dtype, counter_overflow)
+        bf.add_many(true_positives)
         found_tps = peeling(filter_size, k, bf, all_positives, 1, PAIRS)
         prct_obtained = (len(found_tps)/len(true_positives)) * 100
         avg_blackbox_pairs += prct_obtained/trials
@@ -396,6 +484,7 @@ for fals in dots:
     y7_axis.append(th_whitebox)
     y8_axis.append(th_blackbox_ind)
     y9_axis.append(th_blackbox_pairs)
+    stats_axis.append(average_stats(trial_stats))
 
 f.write("End: " + time.ctime(time.time()) + "\n")
 f.write("Proportion FP/TP\n")
@@ -418,6 +507,8 @@ f.write("Theoretical Blackbox Ind\n")
 f.write(str(y8_axis) + "\n")
 f.write("Theoretical Blackbox Pairs\n")
 f.write(str(y9_axis) + "\n")
+f.write("Filter stats\n")
+f.write(str(stats_axis) + "\n")
 f.close()
 
 plt.xlabel('Ratio False positives/True positives')
@@ -447,7 +538,7 @@ plt.plot(x_axis, y7_axis, label=lab7)
 plt.plot(x_axis, y8_axis, label=lab8)
 plt.plot(x_axis, y9_axis, label=lab9)
 plt.legend()
-plt.savefig(str(filter_size) + '_' + str(k) + '_' + str(n) + '.png')
+plt.savefig(output_name + '.png')
 
 
 
@@ -0,0 +1,106 @@
+import importlib
+import json
+
+import numpy as np
+
+from HashBackends import hash_from_config
+
+# Binary file format of the filters:
+#   * MAGIC (8 bytes)
+#   * size of the header (4 bytes, little endian)
+#   * header: JSON object with the config of the filter (see get_config of
+#     the filters), the type and length of the body and the saturated
+#     counters, padded with spaces so the body starts at a multiple of ALIGN
+#   * body: the raw counters, little endian. The lists of ints are stored
+#     as int64, the numpy arrays with their dtype and the packed bits or
+#     counters as their words with their dtype (64 bit words of bits, bytes
+#     of two counters)
+#   * the extra arrays of the filter, if any (see extra_arrays of the d-left
+#     filter), each one starting at a multiple of ALIGN
+# When the counters are a numpy array or packed, the body is
+# memory-mapped when the filter is loaded, so it is not read nor copied
+MAGIC = b'BFPAFLT1'
+ALIGN = 64
+HEADER_SIZE_BYTES = 4
+
+
+# Retrieves the counters of the filter as the array written in the body
+def body_array(bf):
+    counters = bf.bloom_structure
+    if isinstance(counters, list):
+        return np.asarray(counters, dtype='<i8')
+    if hasattr(counters, 'words'):
+        # packed bits or counters (see BitArray and NibbleCounters)
+        return counters.words.astype(counters.words.dtype.newbyteorder('<'), copy=False)
+    return counters.astype(counters.dtype.newbyteorder('<'), copy=False)
+
+
+# Retrieves the extra arrays of the filter, written after the body
+def extra_arrays(bf):
+    if not hasattr(bf, 'extra_arrays'):
+        return {}
+    return {name: array.astype(array.dtype.newbyteorder('<'), copy=False) for name, array in bf.extra_arrays().items()}
+
+
+# Writes the filter bf in the file path
+def save_filter(bf, path):
+    body = body_array(bf)
+    extra = extra_arrays(bf)
+    header = {'filter': bf.get_config(), 'body_dtype': body.dtype.str, 'body_length': body.shape[0],
+              'saturated': getattr(bf, 'saturated', 0),
+              'arrays': [[name, array.dtype.str, array.shape[0]] for name, array in extra.items()]}
+    header = json.dumps(header).encode()
+    # pad the header so the body is aligned
+    start = len(MAGIC) + HEADER_SIZE_BYTES + len(header)
+    header += b' ' * (-start % ALIGN)
+    with open(path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(len(header).to_bytes(HEADER_SIZE_BYTES, 'little'))
+        f.write(header)
+        body.tofile(f)
+        for array in extra.values():
+            f.write(b'\0' * (-f.tell() % ALIGN))
+            array.tofile(f)
+    return
+
+
+# Reads the header of the file path. Returns the header and the offset of
+# the body in the file
+def read_header(path):
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("The file " + path + " is not a saved filter")
+        size = int.from_bytes(f.read(HEADER_SIZE_BYTES), 'little')
+        header = json.loads(f.read(size).decode())
+    return header, len(MAGIC) + HEADER_SIZE_BYTES + size
+
+
+# Creates the filter saved in the file path. Each filter class is found in
+# the module with the same name. mode is the mode of the memory map of the
+# body (see np.memmap): by default 'c' (copy-on-write), so the filter can be
+# modified without changing the file, 'r' to share it read-only between
+# processes, or 'r+' to write the changes back to the file
+def load_filter(path, mode='c'):
+    header, offset = read_header(path)
+    config = dict(header['filter'])
+    class_name = config.pop('class')
+    filter_class = getattr(importlib.import_module(class_name), class_name)
+    hashf = hash_from_config(config.pop('hash'))
+    bf = filter_class(config.pop('m'), config.pop('nhash'), hashf, **config)
+    body = np.memmap(path, dtype=header['body_dtype'], mode=mode, offset=offset, shape=(header['body_length'],))
+    if isinstance(bf.bloom_structure, list):
+        bf.bloom_structure = body.tolist()
+    elif hasattr(bf.bloom_structure, 'words'):
+        bf.bloom_structure.words = body
+    else:
+        bf.bloom_structure = body
+    if hasattr(bf, 'saturated'):
+        bf.saturated = header['saturated']
+    # the extra arrays follow the body, aligned
+    offset += body.nbytes
+    for name, dtype, length in header.get('arrays', []):
+        offset += -offset % ALIGN
+        array = np.memmap(path, dtype=dtype, mode=mode, offset=offset, shape=(length,))
+        setattr(bf, name, array)
+        offset += array.nbytes
+    return bf
@@ -0,0 +1,24 @@
+import hashlib
+from functools import partial
+
+from GenericHashFunctions import GenericHashFunctions, STR_KEYS
+
+
+class GenericHashFunctionsBlake2b(GenericHashFunctions):
+
+    def __init__(self, k=1024, nhash=2, cache_size=0, double_hashing=False, key_encoding=STR_KEYS,
+                 digest_size=16):
+        # the underlying hash function to be used. Just one in this class
+        # the blake2b result (digest_size bytes, between 1 and 64) is split in
+        # a way the subsets are used for all the hash functions. Smaller
+        # digests are faster, but they must have enough bits for all the hashes
+        self.digest_size = digest_size
+        GenericHashFunctions.__init__(self, partial(hashlib.blake2b, digest_size=digest_size),
+                                      8 * digest_size, k, nhash, cache_size, double_hashing, key_encoding)
+        return
+
+    # Retrieves the parameters of the object, including the digest size
+    def get_config(self):
+        config = GenericHashFunctions.get_config(self)
+        config['digest_size'] = self.digest_size
+        return config
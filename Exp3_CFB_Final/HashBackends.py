@@ -0,0 +1,36 @@
+from GenericHashFunctionsMD5 import GenericHashFunctionsMD5
+from GenericHashFunctionsSHA512 import GenericHashFunctionsSHA512
+from GenericHashFunctionsBlake2b import GenericHashFunctionsBlake2b
+from GenericHashFunctionsSplitMix64 import GenericHashFunctionsSplitMix64
+from GenericHashFunctionsRandomOracle import GenericHashFunctionsRandomOracle
+
+# Registry of the hash classes that can be used by the filters. All of them
+# have the same getbit_idx/get_indices/hash_many contract
+HASH_BACKENDS = {
+    'md5': GenericHashFunctionsMD5,
+    'sha512': GenericHashFunctionsSHA512,
+    'blake2b': GenericHashFunctionsBlake2b,
+    'splitmix64': GenericHashFunctionsSplitMix64,
+    'oracle': GenericHashFunctionsRandomOracle,
+}
+
+
+# Creates the hash object of the backend with the given name for a filter
+# with k counters and nhash hashes. Extra parameters (cache_size,
+# double_hashing, digest_size for blake2b, seed for splitmix64 and oracle)
+# are passed to the hash class
+def make_hash(name, k, nhash, **params):
+    if name not in HASH_BACKENDS:
+        raise ValueError("Unknown hash backend " + str(name) + ", choose one of " + ", ".join(HASH_BACKENDS))
+    return HASH_BACKENDS[name](k, nhash, **params)
+
+
+# Creates a hash object equivalent to the one that returned the config
+# with get_config
+def hash_from_config(config):
+    params = dict(config)
+    class_name = params.pop('class')
+    for hash_class in HASH_BACKENDS.values():
+        if hash_class.__name__ == class_name:
+            return hash_class(params.pop('k'), params.pop('nhash'), **params)
+    raise ValueError("Unknown hash class " + str(class_name))
@@ -0,0 +1,78 @@
+import numpy as np
+
+# maximum value of a counter of 4 bits
+NIBBLE_MAX = 15
+NIBBLE_MASK = 0x0F
+
+
+# Array of m counters of 4 bits, packed two in each byte (the counter i is
+# the low nibble of the byte i // 2 when i is even, and the high one when it
+# is odd), so it takes m/2 bytes. It can be indexed and modified like the
+# numpy arrays of counters, one position or an array of positions at a time,
+# and it is unpacked in an array of np.uint8 when it is given to numpy
+class NibbleCounters:
+
+    def __init__(self, m):
+        # number of counters
+        self.m = m
+        self.words = np.zeros((m + 1) >> 1, dtype=np.uint8)
+
+    def __len__(self):
+        return self.m
+
+    # Retrieve the counter at a position, or the counters at an array of
+    # positions (with the same shape)
+    def __getitem__(self, position):
+        if isinstance(position, (int, np.integer)):
+            byte = int(self.words[position >> 1])
+            return (byte >> 4) if position & 1 else (byte & NIBBLE_MASK)
+        if isinstance(position, slice):
+            return self.unpack()[position]
+        position = np.asarray(position, dtype=np.int64)
+        shifts = ((position & 1) << 2).astype(np.uint8)
+        return (self.words[position >> 1] >> shifts) & NIBBLE_MASK
+
+    # Set the counter at a position, or the counters given by a slice or an
+    # array of positions. The values must fit in 4 bits
+    def __setitem__(self, position, value):
+        if isinstance(position, (int, np.integer)):
+            assert 0 <= value <= NIBBLE_MAX
+            byte = int(self.words[position >> 1])
+            if position & 1:
+                byte = (byte & NIBBLE_MASK) | (int(value) << 4)
+            else:
+                byte = (byte & ~NIBBLE_MASK & 0xFF) | int(value)
+            self.words[position >> 1] = byte
+            return
+        values = self.unpack()
+        values[position] = value
+        self.pack(values)
+        return
+
+    # Retrieve all the counters unpacked (a copy), which is used when the
+    # counters are given to numpy (np.asarray)
+    def __array__(self, dtype=None, copy=None):
+        values = self.unpack()
+        return values if dtype is None else values.astype(dtype)
+
+    # Retrieve all the counters in an array of np.uint8, one for each position
+    def unpack(self):
+        values = np.empty(self.words.shape[0] << 1, dtype=np.uint8)
+        values[0::2] = self.words & NIBBLE_MASK
+        values[1::2] = self.words >> 4
+        return values[:self.m]
+
+    # Store the m counters of an array, which must fit in 4 bits
+    def pack(self, values):
+        values = np.asarray(values)
+        assert values.shape[0] == self.m and (values.shape[0] == 0 or values.max() <= NIBBLE_MAX)
+        padded = np.zeros(self.words.shape[0] << 1, dtype=np.uint8)
+        padded[:self.m] = values
+        self.words[:] = padded[0::2] | (padded[1::2] << 4)
+        return
+
+    # Set all the counters to the same value
+    def fill(self, value):
+        assert 0 <= value <= NIBBLE_MAX
+        self.words.fill(value | (value << 4))
+        return